@@ -0,0 +1,397 @@
+#!/usr/bin/env python3
+"""
+bench_cleanup_dropbox_ignored.py
+
+End-to-end scan benchmark for cleanup_dropbox_ignored.py:
+- Generate reproducible Dropbox-like trees (seeded): nested project folders with
+  a share of junk (node_modules, __pycache__, .venv, LaTeX aux files, ...).
+  Files are sparse, so a large tree costs inodes but little disk.
+- Run collect_matches on each tree with the real rules.dropboxignore, once per
+  engine, in a child process each (peak RSS is per process).
+- Report files/s, peak RSS and per-stage times, and save them as JSON so runs can
+  be compared between commits (--baseline).
+
+Put the trees on tmpfs (e.g. --trees /dev/shm/...) to measure the matcher rather
+than the disk; repeated runs are warm-cache runs either way.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import random
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Optional
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+
+import cleanup_dropbox_ignored as cdi  # noqa: E402
+
+TREE_FORMAT = 1
+
+# Engine name -> collect_matches options. "index" runs once to fill the scan index,
+# then is measured on the unchanged tree (the incremental case).
+ENGINES: dict[str, dict[str, Any]] = {
+    "find": {"walker": "find"},
+    "find-procs": {"walker": "find", "procs": 4},
+    "scandir": {"walker": "scandir"},
+    "scandir-jobs": {"walker": "scandir", "jobs": 4},
+    "index": {"walker": "scandir", "index": True},
+}
+
+FOLDERS = (
+    "projects papers teaching code data photos admin archive thesis slides notes "
+    "reviews figures scripts results drafts 2019 2020 2021 2022 2023 2024 misc"
+).split()
+PLAIN_FILES = (
+    (".pdf", 400_000),
+    (".tex", 20_000),
+    (".py", 8_000),
+    (".R", 6_000),
+    (".md", 3_000),
+    (".csv", 200_000),
+    (".jpg", 2_000_000),
+    (".docx", 60_000),
+    (".txt", 1_000),
+)
+PACKAGES = "react lodash numpy scipy pandas torch requests click rich yaml".split()
+
+
+# -----------------------------
+# Synthetic trees
+# -----------------------------
+
+
+class TreeBuilder:
+    """
+    Writes one synthetic tree: a skeleton of `depth` levels with `fanout` folders
+    each, `files` files in total, a `junk` share of them in junk units created
+    under random folders. Everything derives from `seed`.
+    """
+
+    def __init__(self, root: Path, seed: int) -> None:
+        self.root = root
+        self.rng = random.Random(seed)
+        self.files = 0
+        self.bytes = 0
+
+    def file(self, rel: str, size: int) -> None:
+        path = self.root / rel
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "wb") as f:
+            f.truncate(size)
+        self.files += 1
+        self.bytes += size
+
+    def skeleton(self, depth: int, fanout: int) -> list[str]:
+        dirs = [""]
+        level = [""]
+        for _ in range(depth):
+            nxt = []
+            for d in level:
+                for name in self.rng.sample(FOLDERS, min(fanout, len(FOLDERS))):
+                    nxt.append(f"{d}/{name}" if d else name)
+            dirs.extend(nxt)
+            level = nxt
+        for d in dirs[1:]:
+            (self.root / d).mkdir(parents=True, exist_ok=True)
+        return dirs
+
+    def plain(self, d: str) -> None:
+        ext, size = self.rng.choice(PLAIN_FILES)
+        name = f"file{self.files}{ext}"
+        self.file(f"{d}/{name}" if d else name, self.rng.randint(0, 2 * size))
+
+    # Junk units, each a handful of files below folder d.
+
+    def node_modules(self, d: str) -> None:
+        base = f"{d}/node_modules" if d else "node_modules"
+        for pkg in self.rng.sample(PACKAGES, 3):
+            self.file(f"{base}/{pkg}/package.json", 1_500)
+            for i in range(self.rng.randint(2, 8)):
+                self.file(f"{base}/{pkg}/lib/m{i}.js", self.rng.randint(500, 30_000))
+            if self.rng.random() < 0.3:
+                dep = self.rng.choice(PACKAGES)
+                self.file(f"{base}/{pkg}/node_modules/{dep}/index.js", 4_000)
+
+    def pycache(self, d: str) -> None:
+        for i in range(self.rng.randint(2, 6)):
+            mod = f"mod{i}"
+            self.file(f"{d}/{mod}.py", 6_000)
+            self.file(f"{d}/__pycache__/{mod}.cpython-311.pyc", 9_000)
+
+    def venv(self, d: str) -> None:
+        site = f"{d}/.venv/lib/python3.11/site-packages"
+        self.file(f"{d}/.venv/pyvenv.cfg", 200)
+        for pkg in self.rng.sample(PACKAGES, 2):
+            for i in range(self.rng.randint(3, 10)):
+                self.file(f"{site}/{pkg}/m{i}.py", self.rng.randint(1_000, 50_000))
+                self.file(f"{site}/{pkg}/__pycache__/m{i}.cpython-311.pyc", 20_000)
+
+    def latex(self, d: str) -> None:
+        stem = f"paper{self.files}"
+        self.file(f"{d}/{stem}.tex", 40_000)
+        for ext in (".aux", ".log", ".bbl", ".blg", ".fls", ".synctex.gz", ".out"):
+            self.file(f"{d}/{stem}{ext}", self.rng.randint(1_000, 300_000))
+        if self.rng.random() < 0.3:
+            for i in range(4):
+                self.file(f"{d}/_minted-{stem}/{i}.pygtex", 2_000)
+
+    def litter(self, d: str) -> None:
+        for name in (".DS_Store", f"._file{self.files}.pdf", f"notes{self.files}.md~"):
+            self.file(f"{d}/{name}" if d else name, self.rng.randint(0, 8_000))
+
+    def build(self, depth: int, fanout: int, files: int, junk: float) -> None:
+        dirs = self.skeleton(depth, fanout)
+        units = (self.node_modules, self.pycache, self.venv, self.latex, self.litter)
+        junk_files = int(files * junk)
+        while self.files < junk_files:
+            self.rng.choice(units)(self.rng.choice(dirs[1:] or dirs))
+        while self.files < files:
+            self.plain(self.rng.choice(dirs))
+
+
+def ensure_tree(
+    trees: Path, depth: int, fanout: int, files: int, junk: float, seed: int
+) -> dict[str, Any]:
+    """The tree for these parameters below trees/, built unless already there."""
+    params = {
+        "format": TREE_FORMAT,
+        "depth": depth,
+        "fanout": fanout,
+        "files": files,
+        "junk": junk,
+        "seed": seed,
+    }
+    root = trees / f"d{depth}-f{fanout}-n{files}-j{junk:g}-s{seed}"
+    manifest = root.with_name(root.name + ".json")
+    try:
+        info = json.loads(manifest.read_text(encoding="utf-8"))
+        if info["params"] == params and root.is_dir():
+            return info
+    except (OSError, ValueError, KeyError):
+        pass
+    shutil.rmtree(root, ignore_errors=True)
+    t0 = time.perf_counter()
+    b = TreeBuilder(root, seed)
+    b.build(depth, fanout, files, junk)
+    info = {
+        "params": params,
+        "path": str(root),
+        "files": b.files,
+        "bytes": b.bytes,
+        "build_seconds": round(time.perf_counter() - t0, 3),
+    }
+    manifest.write_text(json.dumps(info, indent=2) + "\n", "utf-8")
+    return info
+
+
+# -----------------------------
+# Runs
+# -----------------------------
+
+
+def run_child(spec: dict[str, Any]) -> dict[str, Any]:
+    """One collect_matches run in this (fresh) process; spec as built by run_one."""
+    cdi.setup_logging(0)
+    opts = dict(ENGINES[spec["engine"]])
+    work = Path(spec["work"])
+    index_path = work / "index.sqlite" if opts.pop("index", False) else None
+    kwargs = dict(
+        root=Path(spec["root"]),
+        rules_path=Path(spec["rules"]),
+        progress=False,
+        count_first=False,
+        progress_every=0,
+        index_path=index_path,
+        **opts,
+    )
+    if index_path is not None:
+        cdi.collect_matches(list_out=work / "warmup.txt", **kwargs)
+    metrics = cdi.Metrics()
+    t0 = time.perf_counter()
+    _, total, scanned, count = cdi.collect_matches(
+        list_out=work / "list.txt", metrics=metrics, **kwargs
+    )
+    seconds = time.perf_counter() - t0
+    report = metrics.report()
+    return {
+        "engine": spec["engine"],
+        "seconds": round(seconds, 6),
+        "files": scanned,
+        "files_per_s": round(scanned / max(seconds, 1e-9), 1),
+        "matches": count,
+        "bytes": total,
+        # KiB on Linux; children are the find and worker processes.
+        "peak_rss_kib": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+        "peak_rss_children_kib": resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss,
+        "stages": report["stages"],
+    }
+
+
+def run_one(engine: str, tree: dict[str, Any], rules: Path) -> dict[str, Any]:
+    with tempfile.TemporaryDirectory(prefix="bench-cdi-") as work:
+        spec = {"engine": engine, "root": tree["path"], "rules": str(rules)}
+        spec["work"] = work
+        proc = subprocess.run(
+            [
+                sys.executable,
+                str(Path(__file__).resolve()),
+                "--child",
+                json.dumps(spec),
+            ],
+            stdout=subprocess.PIPE,
+            check=True,
+        )
+    return json.loads(proc.stdout)
+
+
+def git_commit() -> Optional[str]:
+    try:
+        proc = subprocess.run(
+            ["git", "-C", str(HERE), "describe", "--always", "--dirty"],
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            check=True,
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return proc.stdout.strip() or None
+
+
+def compare(results: dict[str, Any], baseline_path: Path) -> None:
+    """Print files/s of each (tree, engine) against a previous results file."""
+    base = json.loads(baseline_path.read_text(encoding="utf-8"))
+    before = {
+        (json.dumps(t["tree"]["params"], sort_keys=True), r["engine"]): r
+        for t in base["trees"]
+        for r in t["runs"]
+    }
+    print(f"vs {baseline_path} ({base.get('commit') or 'unknown commit'}):")
+    for t in results["trees"]:
+        key = json.dumps(t["tree"]["params"], sort_keys=True)
+        for r in t["runs"]:
+            old = before.get((key, r["engine"]))
+            if old is None:
+                continue
+            print(
+                f"  {Path(t['tree']['path']).name:<28} {r['engine']:<13} "
+                f"{old['files_per_s']:>10.0f} -> {r['files_per_s']:>10.0f} files/s "
+                f"({r['files_per_s'] / max(old['files_per_s'], 1e-9):.2f}x)"
+            )
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        description="Benchmark cleanup_dropbox_ignored.py scans on synthetic trees."
+    )
+    default_trees = Path(
+        "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    )
+    p.add_argument(
+        "--trees",
+        type=Path,
+        default=default_trees / "bench_cleanup_dropbox_ignored",
+        help="Where synthetic trees are built and kept for later runs.",
+    )
+    p.add_argument(
+        "--files",
+        default="20000,100000",
+        help="Comma-separated tree sizes (files per tree).",
+    )
+    p.add_argument("--depth", type=int, default=4, help="Folder levels.")
+    p.add_argument("--fanout", type=int, default=5, help="Subfolders per folder.")
+    p.add_argument(
+        "--junk", type=float, default=0.3, help="Share of files that are junk."
+    )
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument(
+        "--rules",
+        type=Path,
+        default=HERE / "rules.dropboxignore",
+        help="Rules file (default: the one next to this script).",
+    )
+    p.add_argument(
+        "--engines",
+        default="find,scandir",
+        help=f"Comma-separated engines among: {', '.join(ENGINES)}.",
+    )
+    p.add_argument(
+        "--repeat", type=int, default=3, help="Runs per engine; the fastest is kept."
+    )
+    p.add_argument(
+        "--output", type=Path, default=None, help="Write the results as JSON."
+    )
+    p.add_argument(
+        "--baseline",
+        type=Path,
+        default=None,
+        help="Previous --output file to compare files/s against.",
+    )
+    p.add_argument("--child", default=None, help=argparse.SUPPRESS)
+    return p
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.child is not None:
+        json.dump(run_child(json.loads(args.child)), sys.stdout)
+        return 0
+
+    engines = [e for e in args.engines.split(",") if e]
+    unknown = [e for e in engines if e not in ENGINES]
+    if unknown:
+        print(f"Unknown engines: {', '.join(unknown)}", file=sys.stderr)
+        return 2
+    trees = args.trees.expanduser()
+    trees.mkdir(parents=True, exist_ok=True)
+    rules = args.rules.expanduser().resolve()
+
+    results: dict[str, Any] = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpus": os.cpu_count(),
+        "rules": str(rules),
+        "trees": [],
+    }
+    for n in (int(x) for x in args.files.split(",") if x):
+        tree = ensure_tree(trees, args.depth, args.fanout, n, args.junk, args.seed)
+        print(f"{tree['path']}: {tree['files']} files, {tree['bytes']} bytes")
+        runs = []
+        for engine in engines:
+            best = min(
+                (run_one(engine, tree, rules) for _ in range(max(1, args.repeat))),
+                key=lambda r: r["seconds"],
+            )
+            runs.append(best)
+            print(
+                f"  {engine:<13} {best['files_per_s']:>10.0f} files/s  "
+                f"{best['seconds']:8.3f}s  "
+                f"peak RSS {best['peak_rss_kib'] / 1024:.0f} MiB  "
+                f"{best['matches']} matches"
+            )
+        results["trees"].append({"tree": tree, "runs": runs})
+
+    if args.output is not None:
+        out = args.output.expanduser()
+        out.parent.mkdir(parents=True, exist_ok=True)
+        out.write_text(json.dumps(results, indent=2) + "\n", "utf-8")
+        print(f"Results: {out}")
+    if args.baseline is not None:
+        compare(results, args.baseline.expanduser())
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,279 @@
+#!/usr/bin/env python3
+"""
+bench_matcher_cleanup_dropbox_ignored.py
+
+Matcher check and microbenchmark for cleanup_dropbox_ignored.py, for one rules file:
+- Differential fuzzing: generated relative paths (built from the rules' own
+  patterns, with case changes, near misses and non-ASCII names) go through every
+  matcher code path and through the reference oracle, the ordered evaluation of
+  _trusted_match (the last matching rule decides). Any disagreement is reported,
+  and the exit status is 1.
+- Microbenchmark: ns per path of each code path over millions of generated paths.
+
+Code paths:
+- fast:     is_ignored (any-match short circuit, or last-match-wins buckets);
+- walker:   the find engine's matcher: DirVerdictCache + bytes for ASCII paths;
+- walker-str: the same on str paths (scandir engines);
+- hot:      walker with checks ordered by rule hits, as after a --rule-stats run
+            (any-match rule sets only);
+- rule:     matching_rule, the deciding rule index used by reports;
+- trusted:  the oracle (benchmarked on fewer paths: it is slow by design).
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+from typing import Callable, Iterator, Optional
+
+HERE = Path(__file__).resolve().parent
+sys.path.insert(0, str(HERE))
+
+import cleanup_dropbox_ignored as cdi  # noqa: E402
+
+GENERIC = (
+    "src data Build lib notes a.txt README x.tar.gz .hidden Photos 2024 main.py "
+    "report.PDF dir.d a-b_c v1.2.3 Ünïcode straße İstanbul café.tex a[1] #tmp# "
+    "with space .x. x~ ~x"
+).split()
+FILLERS = ("", "x", "a.b", "Foo", ".", "-1", "é", "x/", "..")
+CHARS = "abcxyz019._-~#[]! éÄ"
+
+
+# -----------------------------
+# Path generation
+# -----------------------------
+
+
+def _fill(part: str, rng: random.Random) -> str:
+    """A component derived from a glob component: usually a match, sometimes not."""
+    out: list[str] = []
+    i, n = 0, len(part)
+    while i < n:
+        c = part[i]
+        i += 1
+        if c == "*":
+            out.append(rng.choice(FILLERS).replace("/", ""))
+        elif c == "?":
+            out.append(rng.choice(CHARS))
+        elif c == "[" and "]" in part[i + 1 :]:
+            i = part.index("]", i + 1) + 1
+            out.append(rng.choice(CHARS))
+        elif rng.random() < 0.02:
+            pass  # near miss: drop a character
+        else:
+            out.append(c.upper() if rng.random() < 0.2 else c)
+    if rng.random() < 0.03:
+        out.append(rng.choice(CHARS))  # near miss: one more character
+    return "".join(out) or "x"
+
+
+def iter_paths(cr: cdi.CompiledRules, seed: int) -> Iterator[str]:
+    """Endless relative file paths mixing rule-derived and generic components."""
+    rng = random.Random(seed)
+    bodies = [
+        [p for p in (cdi._dir_rule_name(pat) or pat).split("/") if p != "**"]
+        for _, _, pat in cr.ordered_raw
+    ]
+    bodies = [b for b in bodies if b] or [["x"]]
+    while True:
+        parts: list[str] = []
+        for _ in range(rng.randint(1, 6)):
+            if rng.random() < 0.5:
+                parts.extend(_fill(p, rng) for p in rng.choice(bodies))
+            else:
+                parts.append(rng.choice(GENERIC))
+        yield "/".join(parts)
+
+
+# -----------------------------
+# Matchers
+# -----------------------------
+
+
+def trusted_rule(rel: str, cr: cdi.CompiledRules) -> int:
+    """Reference: index of the last rule matching rel, per _trusted_match, or -1."""
+    rel_l = rel.lower()
+    for i in range(len(cr.ordered_raw) - 1, -1, -1):
+        if cdi._trusted_match(rel_l, *cr.ordered_raw[i]):
+            return i
+    return -1
+
+
+def rule_hits(cr: cdi.CompiledRules, paths: list[str]) -> list[int]:
+    """Per-rule hits over paths, as --rule-stats counts them."""
+    hits = [0] * len(cr.ordered_raw)
+    for rel in paths:
+        i = cdi.matching_rule(rel, cr)
+        if i >= 0:
+            hits[i] += 1
+    return hits
+
+
+def matchers(
+    cr: cdi.CompiledRules, hits: Optional[list[int]] = None
+) -> dict[str, Callable[[str], bool]]:
+    """
+    Every code path deciding whether a relative file path is ignored, each with
+    fresh caches; "hot" only with hits and any-match semantics.
+    """
+
+    def walker(cr: cdi.CompiledRules) -> Callable[[str], bool]:
+        bcache = cdi.bytes_dir_cache(cr)
+
+        def match(rel: str) -> bool:
+            b = rel.encode("utf-8", "surrogateescape")
+            if b.isascii():
+                return cdi._is_ignored_cached(b.lower(), bcache)
+            return cdi.is_ignored(rel, cr)
+
+        return match
+
+    def walker_str(cr: cdi.CompiledRules) -> Callable[[str], bool]:
+        scache = cdi.DirVerdictCache(cr, "/")
+        return lambda rel: cdi._is_ignored_cached(rel.lower(), scache)
+
+    def rule(rel: str) -> bool:
+        i = cdi.matching_rule(rel, cr)
+        return i >= 0 and not cr.negated[i]
+
+    out = {
+        "fast": lambda rel: cdi.is_ignored(rel, cr),
+        "walker": walker(cr),
+        "walker-str": walker_str(cr),
+        "rule": rule,
+    }
+    if cr.any_match_semantics and hits and any(hits):
+        out["hot"] = walker(cdi.hot_ordered(cr, hits))
+    out["trusted"] = lambda rel: trusted_rule(rel, cr) >= 0
+    return out
+
+
+# -----------------------------
+# Fuzzing / benchmark
+# -----------------------------
+
+
+def fuzz(cr: cdi.CompiledRules, n: int, seed: int, show: int, hits: list[int]) -> int:
+    """Compare every matcher with the oracle on n paths; returns mismatches."""
+    fns = matchers(cr, hits)
+    del fns["trusted"]
+    bad = 0
+    paths = iter_paths(cr, seed)
+    for _ in range(n):
+        rel = next(paths)
+        want_rule = trusted_rule(rel, cr)
+        want = want_rule >= 0 and not cr.negated[want_rule]
+        got = {name: fn(rel) for name, fn in fns.items()}
+        wrong = sorted(name for name, v in got.items() if v != want)
+        got_rule = cdi.matching_rule(rel, cr)
+        if got_rule != want_rule:
+            wrong.append(f"rule index {got_rule} != {want_rule}")
+        if not wrong:
+            continue
+        bad += 1
+        if bad <= show:
+            line = cr.rule_lines[want_rule][0] if want_rule >= 0 else None
+            print(f"MISMATCH {rel!r}: trusted={want} (line {line}); {', '.join(wrong)}")
+    return bad
+
+
+def bench(
+    fn: Callable[[str], bool], paths: list[str], n: int, rounds: int
+) -> Optional[float]:
+    """Best ns per path of fn over n paths (cycling through `paths`)."""
+    if not paths or n <= 0:
+        return None
+    reps, rest = divmod(n, len(paths))
+    work = paths * reps + paths[:rest]
+    best = None
+    for _ in range(rounds):
+        t0 = time.perf_counter_ns()
+        for rel in work:
+            fn(rel)
+        dt = time.perf_counter_ns() - t0
+        best = dt if best is None else min(best, dt)
+    assert best is not None
+    return best / len(work)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        description="Differential fuzzing and ns/path benchmark of the matchers."
+    )
+    p.add_argument(
+        "--rules",
+        type=Path,
+        default=HERE / "rules.dropboxignore",
+        help="Rules file (default: the one next to this script).",
+    )
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument(
+        "--fuzz",
+        type=int,
+        default=20_000,
+        help="Paths checked against the oracle (about 1 ms each for 100 rules).",
+    )
+    p.add_argument("--show", type=int, default=20, help="Mismatches printed at most.")
+    p.add_argument(
+        "--paths",
+        type=int,
+        default=2_000_000,
+        help="Paths per benchmarked matcher (0 skips the benchmark).",
+    )
+    p.add_argument(
+        "--trusted-paths",
+        type=int,
+        default=20_000,
+        help="Paths for the (slow) trusted oracle.",
+    )
+    p.add_argument(
+        "--distinct",
+        type=int,
+        default=100_000,
+        help="Distinct generated paths the benchmark cycles through.",
+    )
+    p.add_argument("--rounds", type=int, default=3, help="Best of N rounds.")
+    return p
+
+
+def main(argv: Optional[list[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    rules_path = args.rules.expanduser()
+    cr = cdi.compile_rules(rules_path)
+    print(
+        f"{rules_path}: {len(cr.ordered_raw)} rules, {len(cr.fallback)} regex, "
+        + ("any-match" if cr.any_match_semantics else "last-match-wins")
+    )
+
+    # Hit counts for the "hot" matcher, from paths neither run uses.
+    gen = iter_paths(cr, args.seed + 2)
+    hits = rule_hits(cr, [next(gen) for _ in range(10_000)])
+
+    bad = 0
+    if args.fuzz > 0:
+        t0 = time.perf_counter()
+        bad = fuzz(cr, args.fuzz, args.seed, args.show, hits)
+        print(
+            f"fuzz: {args.fuzz} paths, {bad} mismatches "
+            f"({time.perf_counter() - t0:.1f}s)"
+        )
+
+    if args.paths > 0:
+        gen = iter_paths(cr, args.seed + 1)
+        paths = [next(gen) for _ in range(max(1, args.distinct))]
+        ignored = sum(cdi.is_ignored(p, cr) for p in paths)
+        print(f"bench: {len(paths)} distinct paths, {ignored} ignored")
+        for name in matchers(cr, hits):
+            n = args.trusted_paths if name == "trusted" else args.paths
+            ns = bench(matchers(cr, hits)[name], paths, n, args.rounds)
+            if ns is not None:
+                print(f"  {name:<11} {ns:10.0f} ns/path  ({n} paths)")
+    return 1 if bad else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -5,7 +5,8 @@ cleanup_dropbox_ignored.py
 Linux:
 - Enumerate files via `find <root> -type f -print0`.
 - Fast ignore evaluation for simplified Dropbox rules: structural predicates.
-- Fallback to trusted PurePosixPath.match + suffix loop for unclassified patterns.
+- Unclassified patterns are translated into one combined, precompiled regex.
+- A trusted component-wise glob matcher is kept as the reference oracle.
 
 WARNING:
 - Deleting/moving inside Dropbox affects the cloud state.
@@ -15,16 +16,44 @@ WARNING:
 from __future__ import annotations
 
 import argparse
+import ctypes
+import errno
+import hashlib
+import heapq
+import itertools
 import json
 import logging
 import os
+import queue
+import re
+import select
 import shutil
+import signal
+import sqlite3
+import stat
+import struct
 import subprocess
 import sys
+import threading
 import time
-from dataclasses import dataclass
-from pathlib import Path, PurePosixPath
-from typing import Iterator, Optional, Tuple
+from array import array
+from collections import deque
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from dataclasses import dataclass, field, replace
+from fnmatch import fnmatchcase
+from functools import cached_property, lru_cache, partial
+from pathlib import Path
+from typing import (
+    Any,
+    AnyStr,
+    Callable,
+    Iterable,
+    Iterator,
+    Optional,
+    Sequence,
+    Tuple,
+)
 
 LOG = logging.getLogger("cleanup_dropbox_ignored")
 
@@ -34,14 +63,15 @@ LOG = logging.getLogger("cleanup_dropbox_ignored")
 # -----------------------------
 
 
-def setup_logging(verbosity: int) -> None:
+def setup_logging(verbosity: int, prefix: str = "") -> None:
     level = (
         logging.WARNING
         if verbosity <= 0
         else (logging.INFO if verbosity == 1 else logging.DEBUG)
     )
     h = logging.StreamHandler(stream=sys.stderr)
-    h.setFormatter(logging.Formatter("%(levelname)s: %(message)s"))
+    prefix = prefix.replace("%", "%%")
+    h.setFormatter(logging.Formatter(f"%(levelname)s: {prefix}%(message)s"))
     LOG.handlers.clear()
     LOG.addHandler(h)
     LOG.setLevel(level)
@@ -60,34 +90,159 @@ def maybe_tqdm(enabled: bool, total: Optional[int], desc: str) -> Optional[objec
     return tqdm(total=total, unit="files", dynamic_ncols=True, desc=desc)
 
 
+# -----------------------------
+# Metrics
+# -----------------------------
+
+
+@dataclass
+class _StageStats:
+    calls: int = 0
+    timed: int = 0  # calls whose duration was measured
+    seconds: float = 0.0  # summed over the timed calls
+    items: int = 0
+
+
+@dataclass
+class Metrics:
+    """
+    Cumulative time and item counts per pipeline stage, for --metrics-json.
+
+    Per-chunk and one-off stages are timed on every call. Per-directory stages are
+    sampled (see sampled): one call in sample_every is timed and the stage total
+    extrapolated from those, so the walk loop rarely reads the clock.
+    """
+
+    sample_every: int = 16
+    stages: dict[str, _StageStats] = field(default_factory=dict)
+    started: float = field(default_factory=time.time)
+    _t0: float = field(default_factory=time.perf_counter)
+
+    def _stage(self, name: str) -> _StageStats:
+        st = self.stages.get(name)
+        if st is None:
+            st = self.stages[name] = _StageStats()
+        return st
+
+    def add(self, name: str, seconds: Optional[float], items: int = 0) -> None:
+        """Account one call of a stage; seconds is None for an untimed call."""
+        st = self._stage(name)
+        st.calls += 1
+        st.items += items
+        if seconds is not None:
+            st.timed += 1
+            st.seconds += seconds
+
+    def sampled(self, name: str) -> bool:
+        """Whether the next call of a sampled stage should be timed."""
+        return self._stage(name).calls % self.sample_every == 0
+
+    @contextmanager
+    def stage(self, name: str, items: int = 0) -> Iterator[None]:
+        t0 = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - t0, items)
+
+    def report(self, **info: Any) -> dict[str, Any]:
+        stages = {
+            name: {
+                "seconds": (
+                    round(st.seconds * st.calls / st.timed, 6) if st.timed else 0.0
+                ),
+                "calls": st.calls,
+                "timed_calls": st.timed,
+                "items": st.items,
+            }
+            for name, st in self.stages.items()
+        }
+        return {
+            "started": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(self.started)),
+            "wall_seconds": round(time.perf_counter() - self._t0, 6),
+            **info,
+            "stages": stages,
+        }
+
+    def write(self, path: Path, **info: Any) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.report(**info), indent=2) + "\n", "utf-8")
+
+
+def timed(
+    metrics: Optional[Metrics], name: str, items: int = 0
+) -> AbstractContextManager[None]:
+    """metrics.stage(name, items), or a no-op without metrics."""
+    return metrics.stage(name, items) if metrics is not None else nullcontext()
+
+
+def _timed_chunks(chunks: Iterator[bytes], metrics: Metrics) -> Iterator[bytes]:
+    """Pass find chunks through, accounting the time spent reading them."""
+    while True:
+        t0 = time.perf_counter()
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        metrics.add("enumerate", time.perf_counter() - t0, chunk.count(b"\0"))
+        yield chunk
+
+
+def _timed_batches(
+    batches: Iterator[Tuple[int, list[Match]]], metrics: Metrics, name: str
+) -> Iterator[Tuple[int, list[Match]]]:
+    """Pass batches through, accounting the time spent producing them (sampled)."""
+    while True:
+        t0 = time.perf_counter() if metrics.sampled(name) else None
+        try:
+            n, found = next(batches)
+        except StopIteration:
+            return
+        metrics.add(name, None if t0 is None else time.perf_counter() - t0, n)
+        yield n, found
+
+
 # -----------------------------
 # Dropbox root detection
 # -----------------------------
 
 
-def detect_dropbox_root() -> Path:
+def detect_dropbox_roots() -> list[Tuple[str, Path]]:
+    """
+    (account, root) of every account linked in ~/.dropbox/info.json, personal
+    then business then any other; else ~/Dropbox as the "default" account.
+    Roots are resolved, like the paths of the matches found under them.
+    """
+    roots: list[Tuple[str, Path]] = []
     info = Path.home() / ".dropbox" / "info.json"
     if info.exists():
         try:
             data = json.loads(info.read_text(encoding="utf-8"))
-            for key in ("personal", "business"):
-                if key in data and isinstance(data[key], dict) and "path" in data[key]:
-                    return Path(data[key]["path"]).expanduser()
-            for val in data.values():
+            keys = [k for k in ("personal", "business") if k in data]
+            keys += [k for k in data if k not in ("personal", "business")]
+            for key in keys:
+                val = data[key]
                 if isinstance(val, dict) and "path" in val:
-                    return Path(val["path"]).expanduser()
+                    path = Path(val["path"]).expanduser().resolve()
+                    if all(path != p for _, p in roots):
+                        roots.append((str(key), path))
         except Exception as e:
             LOG.debug("Failed reading %s: %s", info, e)
+    if roots:
+        return roots
 
     fallback = Path.home() / "Dropbox"
     if fallback.exists():
-        return fallback
+        return [("default", fallback.resolve())]
 
     raise FileNotFoundError(
         "Could not determine Dropbox root. Pass --root PATH explicitly."
     )
 
 
+def detect_dropbox_root() -> Path:
+    return detect_dropbox_roots()[0][1]
+
+
 # -----------------------------
 # Rule compilation: fast predicates + fallback
 # -----------------------------
@@ -99,8 +254,116 @@ def _has_glob_meta(s: str) -> bool:
     return any(c in _GLOB_META for c in s)
 
 
+def _dir_rule_name(tail: str) -> Optional[str]:
+    """
+    Return <name> for directory rules written as '<name>/**' or '<name>/', else None.
+    Both forms ignore everything below a directory called <name>; neither matches
+    a plain file called <name>.
+    """
+    name = None
+    while True:
+        if tail.endswith("/**"):
+            tail = tail[:-3]
+        elif tail.endswith("/"):
+            tail = tail[:-1]
+        else:
+            return name
+        name = tail
+
+
+def _glob_component_regex(part: str) -> str:
+    """
+    Translate one path component of a glob into a regex fragment.
+    Same dialect as fnmatch ('*', '?', '[seq]', '[!seq]'), but nothing crosses '/'.
+    """
+    out: list[str] = []
+    i, n = 0, len(part)
+    while i < n:
+        c = part[i]
+        i += 1
+        if c == "*":
+            if not out or out[-1] != "[^/]*":
+                out.append("[^/]*")
+        elif c == "?":
+            out.append("[^/]")
+        elif c == "[":
+            j = i
+            if j < n and part[j] == "!":
+                j += 1
+            if j < n and part[j] == "]":
+                j += 1
+            while j < n and part[j] != "]":
+                j += 1
+            if j >= n:
+                out.append("\\[")
+                continue
+            stuff = part[i:j].replace("\\", "\\\\")
+            stuff = re.sub(r"([&~|\[])", r"\\\1", stuff)
+            i = j + 1
+            if stuff.startswith("!"):
+                out.append("(?!/)[^" + stuff[1:] + "]")
+            elif stuff.startswith("^"):
+                out.append("[\\" + stuff + "]")
+            else:
+                out.append("[" + stuff + "]")
+        else:
+            out.append(re.escape(c))
+    return "".join(out)
+
+
+def _glob_regex(anchored: bool, pat2: str, as_dir: bool = False) -> str:
+    """
+    Translate a normalized rule into a regex matched (re.match) against a lowercase
+    relative path. '**' spans zero or more whole components; unanchored rules may
+    start at any component boundary; directory rules ('name/', 'name/**') match
+    everything below a matching directory but not the directory name as a file.
+    With as_dir=True, a directory rule instead matches the directory path itself.
+    """
+    dir_name = _dir_rule_name(pat2)
+    body = pat2 if dir_name is None else dir_name
+    parts = body.split("/")
+    if not anchored:
+        # Unanchored rules already start at any component boundary; a leading '**'
+        # would only add a second, redundant (and backtracking) prefix.
+        while len(parts) > 1 and parts[0] == "**":
+            parts = parts[1:]
+    out = [] if anchored else ["(?:.*/)?"]
+    for i, part in enumerate(parts):
+        last = i == len(parts) - 1
+        if part == "**":
+            out.append(".*" if last else "(?:.*/)?")
+        else:
+            out.append(_glob_component_regex(part) + ("" if last else "/"))
+    out.append("/" if dir_name is not None and not as_dir else "\\Z")
+    return "".join(out)
+
+
+def _combined_regex(
+    rules: list[FallbackRule], as_dir: bool = False, hits: Sequence[int] = ()
+) -> Tuple[Optional[re.Pattern[str]], Tuple[int, ...]]:
+    """
+    One alternation over all rules, so a path costs a single re.match call.
+    Alternatives are ordered by descending rule index and each sits in its own
+    group: the first alternative that matches is the last rule in file order, and
+    m.lastindex maps back to it through the returned group -> rule index table.
+
+    With per-rule hits (any-match semantics only), the most matched rules come
+    first instead: the group found is then just one of the matching rules.
+    """
+    if not rules:
+        return None, ()
+    if hits:
+        ordered = sorted(rules, key=lambda r: (-hits[r.index], -r.index))
+    else:
+        ordered = sorted(rules, key=lambda r: r.index, reverse=True)
+    alts = ["(" + _glob_regex(r.anchored, r.pat2, as_dir) + ")" for r in ordered]
+    group_rule = (-1,) + tuple(r.index for r in ordered)
+    return re.compile("|".join(alts), re.DOTALL), group_rule
+
+
 @dataclass(frozen=True)
 class FallbackRule:
+    index: int  # position among active rules (last match wins)
     negated: bool
     anchored: bool
     pat2: str  # lower, without leading '/'
@@ -108,189 +371,309 @@ class FallbackRule:
 
 @dataclass
 class CompiledRules:
-    # If True, we can short-circuit on first match (no negations, no anchored rules).
+    # If True, we can short-circuit on first match (no negations).
     any_match_semantics: bool
 
-    # Basename tests (lowercase)
-    basename_exact: set[str]
-    basename_prefix: tuple[str, ...]
-    basename_suffix: tuple[str, ...]
-    # special basename shapes
-    basename_endswith_tilde: bool
-    basename_hash_wrapped: bool  # #*#
-    basename_prefix_dot_underscore: bool  # ._*
-    basename_prefix_dot_hash: bool  # .#*
+    # Every bucket maps its key to the highest index of the rules that produced it,
+    # so last-match-wins is a max over the hits (see _last_match).
 
-    # Directory/component tests (lowercase), applied to directory components only
-    dir_exact: set[str]
-    dir_prefix: tuple[str, ...]
-    dir_suffix: tuple[str, ...]  # e.g. ".egg-info"
+    # Basename tests (lowercase); '._*', '.#*' and '*~' are plain prefix/suffix
+    # entries, so the matchers need no literals and also run on bytes.
+    basename_exact: dict[str, int]
+    basename_prefix: dict[str, int]
+    basename_suffix: dict[str, int]
 
-    # Fallback (trusted matcher) rules, in original order
+    # Directory/component tests (lowercase), applied to directory components only
+    dir_exact: dict[str, int]
+    dir_prefix: dict[str, int]
+    dir_suffix: dict[str, int]  # e.g. ".egg-info"
+
+    # Prefix/suffix buckets are probed with hash lookups instead of scanning their
+    # keys, so a name costs the same whatever the number of prefixes/suffixes:
+    # - suffixes starting with '.' (extensions): one lookup of name[j:] per '.' in
+    #   the name (the *_dotted flags say whether any exist);
+    # - other keys: one lookup of name[:n] / name[-n:] per distinct key length.
+    dot: str  # "." (b"." in bytes_twin)
+    basename_prefix_lens: Tuple[int, ...]
+    basename_suffix_lens: Tuple[int, ...]
+    basename_suffix_dotted: bool
+    dir_prefix_lens: Tuple[int, ...]
+    dir_suffix_lens: Tuple[int, ...]
+    dir_suffix_dotted: bool
+
+    # Fallback rules, in original order, and their combined regex (None if empty);
+    # fallback_group_rule maps a regex group number to its rule index.
     fallback: list[FallbackRule]
-
-    # For full semantics (negations/anchored), keep all rules in order (fast+fallback)
-    # as normalized raw patterns; used only if any_match_semantics=False.
+    fallback_re: Optional[re.Pattern[str]]
+    fallback_group_rule: Tuple[int, ...]
+    # Same rules split for the directory walker: directory rules matched against a
+    # directory's own path, everything else against a file path.
+    fallback_dir_re: Optional[re.Pattern[str]]
+    fallback_dir_group_rule: Tuple[int, ...]
+    fallback_file_re: Optional[re.Pattern[str]]
+    fallback_file_group_rule: Tuple[int, ...]
+
+    # negated[i] is the negation flag of rule i; decides the last-match verdict.
+    negated: Tuple[bool, ...]
+    # Highest index of a negated rule (-1 if none): a directory decided by a later
+    # rule cannot have anything re-included below it.
+    last_negated: int
+
+    # All rules in order as normalized raw patterns; input of the reference oracle.
     ordered_raw: list[Tuple[bool, bool, str]]  # (negated, anchored, pat2_lower)
+    # (line number, text) of each rule in the rules file, for reports.
+    rule_lines: list[Tuple[int, str]]
+    # Per-rule hits of a previous scan (see hot_ordered), empty by default. When
+    # set, probes and fallback alternatives are ordered by them and the matchers
+    # return on the first hit instead of the last matching rule.
+    hot: Tuple[int, ...] = ()
+
+    @cached_property
+    def bytes_twin(self) -> CompiledRules:
+        """
+        The same rules with UTF-8 bytes keys and bytes regexes, for matching
+        ASCII-only paths without decoding them (non-ASCII paths use the str rules:
+        their case folding is not a byte operation).
+        """
+
+        def enc(d: dict[str, int]) -> dict[bytes, int]:
+            return {k.encode("utf-8"): v for k, v in d.items()}
+
+        def enc_re(rx: Optional[re.Pattern[str]]) -> Optional[re.Pattern[bytes]]:
+            if rx is None:
+                return None
+            return re.compile(rx.pattern.encode("utf-8"), rx.flags & ~re.UNICODE)
+
+        basename_prefix = enc(self.basename_prefix)
+        basename_suffix = enc(self.basename_suffix)
+        dir_prefix = enc(self.dir_prefix)
+        dir_suffix = enc(self.dir_suffix)
+        return replace(
+            self,
+            basename_exact=enc(self.basename_exact),
+            basename_prefix=basename_prefix,
+            basename_suffix=basename_suffix,
+            dir_exact=enc(self.dir_exact),
+            dir_prefix=dir_prefix,
+            dir_suffix=dir_suffix,
+            # UTF-8 lengths differ from str lengths for non-ASCII keys.
+            dot=b".",
+            basename_prefix_lens=_key_lengths(basename_prefix, hits=self.hot),
+            basename_suffix_lens=_key_lengths(
+                basename_suffix, skip=b".", hits=self.hot
+            ),
+            dir_prefix_lens=_key_lengths(dir_prefix, hits=self.hot),
+            dir_suffix_lens=_key_lengths(dir_suffix, skip=b".", hits=self.hot),
+            fallback_re=enc_re(self.fallback_re),
+            fallback_dir_re=enc_re(self.fallback_dir_re),
+            fallback_file_re=enc_re(self.fallback_file_re),
+        )
 
 
-def compile_rules(rules_path: Path) -> CompiledRules:
-    basename_exact: set[str] = set()
-    basename_prefix: list[str] = []
-    basename_suffix: list[str] = []
+def _classify_rule(pat: str) -> Tuple[str, str]:
+    """
+    Return (bucket, key) for a normalized pattern. bucket is a CompiledRules
+    attribute name, "fallback" if no fast form fits, or "skip" if meaningless.
+    """
+    # We primarily support patterns of these forms:
+    # - **/<name>              (basename match)
+    # - **/<name>/**           (directory/component match)
+    # - **/<name>/             (directory/component match, Dropbox's usual form)
+    # where <name> may include a single trailing '*' (prefix, e.g. '._*', '.#*'),
+    # or a single leading '*' (suffix, e.g. '*.aux', '*~', '*.egg-info'),
+    # or be '.coverage.*' (prefix). Anything else (e.g. '#*#') uses the regex.
+    if not pat.startswith("**/"):
+        return "fallback", pat
+    tail = pat[3:]
+
+    # Directory-tree pattern?
+    name = _dir_rule_name(tail)
+    if name is not None:
+        # Too risky to "optimize" multi-component directory patterns; fallback.
+        if "/" in name:
+            return "fallback", pat
+        if name == "**":
+            # meaningless
+            return "skip", name
+        # Component patterns
+        if not _has_glob_meta(name):
+            return "dir_exact", name
+        # prefix: foo*
+        if name.endswith("*") and not _has_glob_meta(name[:-1]):
+            return "dir_prefix", name[:-1]
+        # suffix: *.egg-info
+        if len(name) > 1 and name.startswith("*") and not _has_glob_meta(name[1:]):
+            return "dir_suffix", name[1:]  # ".egg-info"
+        return "fallback", pat
+
+    # Basename-ish pattern (file name in any directory)
+    name = tail
+    if "/" in name:
+        # unexpected here; fallback
+        return "fallback", pat
+
+    # Prefix .coverage.* => prefix ".coverage." (keep trailing '.')
+    if name.endswith(".*") and not _has_glob_meta(name[:-2]):
+        return "basename_prefix", name[:-1]
+    # Simple exact
+    if not _has_glob_meta(name):
+        return "basename_exact", name
+    # Suffix *.ext or *.synctex.gz or *.so.pyd or *~
+    if len(name) > 1 and name.startswith("*") and not _has_glob_meta(name[1:]):
+        return "basename_suffix", name[1:]  # ".ext" (including multi-dot)
+    # Prefix foo* (rare for basenames in your set, but keep)
+    if name.endswith("*") and not _has_glob_meta(name[:-1]):
+        return "basename_prefix", name[:-1]
+    return "fallback", pat
+
+
+def _key_lengths(
+    d: dict[AnyStr, int], skip: Optional[AnyStr] = None, hits: Sequence[int] = ()
+) -> Tuple[int, ...]:
+    """
+    Distinct key lengths, ignoring keys that start with `skip`. Sorted, or with
+    per-rule hits, by the hits of the keys of each length (hottest first).
+    """
+    lens = sorted({len(k) for k in d if skip is None or not k.startswith(skip)})
+    if hits:
+        heat = dict.fromkeys(lens, 0)
+        for k, i in d.items():
+            if len(k) in heat and not (skip is not None and k.startswith(skip)):
+                heat[len(k)] += hits[i]
+        lens.sort(key=lambda n: -heat[n])
+    return tuple(lens)
+
+
+def _fallback_regexes(
+    fallback: list[FallbackRule], hits: Sequence[int] = ()
+) -> dict[str, Any]:
+    """The combined regexes of CompiledRules and their group -> rule tables."""
+    dir_rules = [r for r in fallback if _dir_rule_name(r.pat2) is not None]
+    file_rules = [r for r in fallback if _dir_rule_name(r.pat2) is None]
+    fallback_re, fallback_group_rule = _combined_regex(fallback, hits=hits)
+    dir_re, dir_group_rule = _combined_regex(dir_rules, as_dir=True, hits=hits)
+    file_re, file_group_rule = _combined_regex(file_rules, hits=hits)
+    return {
+        "fallback_re": fallback_re,
+        "fallback_group_rule": fallback_group_rule,
+        "fallback_dir_re": dir_re,
+        "fallback_dir_group_rule": dir_group_rule,
+        "fallback_file_re": file_re,
+        "fallback_file_group_rule": file_group_rule,
+    }
 
-    dir_exact: set[str] = set()
-    dir_prefix: list[str] = []
-    dir_suffix: list[str] = []
 
+def compile_rules(rules_path: Path) -> CompiledRules:
+    tables: dict[str, dict[str, int]] = {
+        name: {}
+        for name in (
+            "basename_exact",
+            "basename_prefix",
+            "basename_suffix",
+            "dir_exact",
+            "dir_prefix",
+            "dir_suffix",
+        )
+    }
     fallback: list[FallbackRule] = []
     ordered_raw: list[Tuple[bool, bool, str]] = []
+    rule_lines: list[Tuple[int, str]] = []
 
-    has_negation = False
-    has_anchored = False
-
-    # These specials are triggered by presence of matching patterns.
-    enable_tilde = False
-    enable_hashwrap = False
-    enable_dot_underscore = False
-    enable_dot_hash = False
-
-    for raw in rules_path.read_text(encoding="utf-8").splitlines():
+    for lineno, raw in enumerate(
+        rules_path.read_text(encoding="utf-8").splitlines(), start=1
+    ):
         s = raw.strip()
         if not s or s.startswith("#"):
             continue
 
         neg = s.startswith("!")
         if neg:
-            has_negation = True
             s = s[1:].strip()
         if not s:
             continue
 
         anchored = s.startswith("/")
         if anchored:
-            has_anchored = True
             s = s.lstrip("/")
 
         pat = s.lower()
+        index = len(ordered_raw)
         ordered_raw.append((neg, anchored, pat))
+        rule_lines.append((lineno, raw.strip()))
 
-        # We primarily support patterns of these forms:
-        # - **/<name>              (basename match)
-        # - **/<name>/**           (directory/component match)
-        # where <name> may include a single trailing '*' (prefix), or a leading '*.' (suffix),
-        # or be '*.egg-info' (component suffix), or simple specials (#*#, ._*, .#*, *~),
-        # or '.coverage.*' (prefix).
-        if pat.startswith("**/"):
-            tail = pat[3:]
-
-            # Directory-tree pattern?
-            if tail.endswith("/**"):
-                name = tail[:-3]  # strip '/**'
-                # If it contains '/', treat as exact directory path component sequence?
-                # In your simplified rules, these are single-component names (possibly with spaces).
-                if "/" in name:
-                    # Too risky to "optimize" multi-component directory patterns; fallback.
-                    fallback.append(
-                        FallbackRule(negated=neg, anchored=anchored, pat2=pat)
-                    )
-                    continue
-
-                if name == "**":
-                    # meaningless
-                    continue
-
-                # Component patterns
-                if not _has_glob_meta(name):
-                    dir_exact.add(name)
-                    continue
-
-                # prefix: foo*
-                if name.endswith("*") and not _has_glob_meta(name[:-1]):
-                    dir_prefix.append(name[:-1])
-                    continue
-
-                # suffix: *.egg-info
-                if name.startswith("*.") and not _has_glob_meta(name[1:]):
-                    dir_suffix.append(name[1:])  # ".egg-info"
-                    continue
-
-                # otherwise fallback
-                fallback.append(FallbackRule(negated=neg, anchored=anchored, pat2=pat))
-                continue
-
-            # Basename-ish pattern (file name in any directory)
-            name = tail
-            if "/" in name:
-                # unexpected here; fallback
-                fallback.append(FallbackRule(negated=neg, anchored=anchored, pat2=pat))
-                continue
-
-            # Specials
-            if name == "*~":
-                enable_tilde = True
-                continue
-            if name == "#*#":
-                enable_hashwrap = True
-                continue
-            if name == "._*":
-                enable_dot_underscore = True
-                continue
-            if name == ".#*":
-                enable_dot_hash = True
-                continue
-
-            # Prefix .coverage.* => prefix ".coverage."
-            if name.endswith(".*") and not _has_glob_meta(name[:-2]):
-                basename_prefix.append(
-                    name[:-1]
-                )  # keep trailing '.' (e.g. ".coverage.")
-                continue
+        # Buckets keep the highest index per key: later rules override earlier ones.
+        bucket, key = _classify_rule(pat)
+        if bucket == "fallback":
+            fallback.append(
+                FallbackRule(index=index, negated=neg, anchored=anchored, pat2=pat)
+            )
+        elif bucket != "skip":
+            tables[bucket][key] = index
 
-            # Simple exact
-            if not _has_glob_meta(name):
-                basename_exact.add(name)
-                continue
-
-            # Suffix *.ext or *.synctex.gz or *.so.pyd
-            if name.startswith("*.") and not _has_glob_meta(name[1:]):
-                basename_suffix.append(name[1:])  # ".ext" (including multi-dot)
-                continue
-
-            # Prefix foo* (rare for basenames in your set, but keep)
-            if name.endswith("*") and not _has_glob_meta(name[:-1]):
-                basename_prefix.append(name[:-1])
-                continue
+    negated = tuple(neg for neg, _, _ in ordered_raw)
 
-            # Otherwise fallback
-            fallback.append(FallbackRule(negated=neg, anchored=anchored, pat2=pat))
-            continue
+    return CompiledRules(
+        # Anchored rules live in the fallback regex and are matched from the root,
+        # so only negations require last-match-wins evaluation.
+        any_match_semantics=not any(negated),
+        basename_exact=tables["basename_exact"],
+        basename_prefix=tables["basename_prefix"],
+        basename_suffix=tables["basename_suffix"],
+        dir_exact=tables["dir_exact"],
+        dir_prefix=tables["dir_prefix"],
+        dir_suffix=tables["dir_suffix"],
+        dot=".",
+        basename_prefix_lens=_key_lengths(tables["basename_prefix"]),
+        basename_suffix_lens=_key_lengths(tables["basename_suffix"], skip="."),
+        basename_suffix_dotted=any(
+            k.startswith(".") for k in tables["basename_suffix"]
+        ),
+        dir_prefix_lens=_key_lengths(tables["dir_prefix"]),
+        dir_suffix_lens=_key_lengths(tables["dir_suffix"], skip="."),
+        dir_suffix_dotted=any(k.startswith(".") for k in tables["dir_suffix"]),
+        fallback=fallback,
+        **_fallback_regexes(fallback),
+        negated=negated,
+        last_negated=max((i for i, neg in enumerate(negated) if neg), default=-1),
+        ordered_raw=ordered_raw,
+        rule_lines=rule_lines,
+    )
 
-        # Anything else: fallback
-        fallback.append(FallbackRule(negated=neg, anchored=anchored, pat2=pat))
 
-    # Dedup + normalize for faster loops
-    basename_prefix_t = tuple(sorted(set(basename_prefix), key=len, reverse=True))
-    basename_suffix_t = tuple(sorted(set(basename_suffix), key=len, reverse=True))
-    dir_prefix_t = tuple(sorted(set(dir_prefix), key=len, reverse=True))
-    dir_suffix_t = tuple(sorted(set(dir_suffix), key=len, reverse=True))
+def hot_ordered(cr: CompiledRules, hits: Sequence[int]) -> CompiledRules:
+    """
+    cr with its prefix/suffix probes and fallback alternatives ordered by per-rule
+    hits, hottest first, and matchers returning on the first hit. Any-match
+    semantics only: the verdicts are unchanged, but the rule indexes found are no
+    longer the deciding rule (matching_rule and reports need the original cr).
+    """
+    if not cr.any_match_semantics:
+        raise ValueError("hot ordering needs any-match semantics (no negations)")
+    hot = tuple(hits)
+    return replace(
+        cr,
+        basename_prefix_lens=_key_lengths(cr.basename_prefix, hits=hot),
+        basename_suffix_lens=_key_lengths(cr.basename_suffix, skip=".", hits=hot),
+        dir_prefix_lens=_key_lengths(cr.dir_prefix, hits=hot),
+        dir_suffix_lens=_key_lengths(cr.dir_suffix, skip=".", hits=hot),
+        **_fallback_regexes(cr.fallback, hot),
+        hot=hot,
+    )
 
-    any_match_semantics = (not has_negation) and (not has_anchored)
 
-    return CompiledRules(
-        any_match_semantics=any_match_semantics,
-        basename_exact=basename_exact,
-        basename_prefix=basename_prefix_t,
-        basename_suffix=basename_suffix_t,
-        basename_endswith_tilde=enable_tilde,
-        basename_hash_wrapped=enable_hashwrap,
-        basename_prefix_dot_underscore=enable_dot_underscore,
-        basename_prefix_dot_hash=enable_dot_hash,
-        dir_exact=dir_exact,
-        dir_prefix=dir_prefix_t,
-        dir_suffix=dir_suffix_t,
-        fallback=fallback,
-        ordered_raw=ordered_raw,
+def _match_parts(parts: list[str], pat_parts: list[str]) -> bool:
+    """Full component-wise match; '**' consumes zero or more whole components."""
+    if not pat_parts:
+        return not parts
+    head = pat_parts[0]
+    if head == "**":
+        return any(
+            _match_parts(parts[i:], pat_parts[1:]) for i in range(len(parts) + 1)
+        )
+    return (
+        bool(parts)
+        and fnmatchcase(parts[0], head)
+        and _match_parts(parts[1:], pat_parts[1:])
     )
 
 
@@ -298,58 +681,64 @@ def _trusted_match(
     rel_posix_lower: str, negated: bool, anchored: bool, pat2: str
 ) -> bool:
     """
-    Trusted semantics (your original):
-    - anchored: PurePosixPath(rel).match(pat2)
-    - unanchored with no '/': PurePosixPath(rel).match(pat2)
-    - unanchored with '/': try all suffixes (component boundary)
-    """
-    p = PurePosixPath(rel_posix_lower)
-    if anchored:
-        return p.match(pat2)
-    if "/" not in pat2:
-        return p.match(pat2)
-    parts = p.parts
-    for i in range(len(parts)):
-        if PurePosixPath(*parts[i:]).match(pat2):
-            return True
+    Trusted semantics (reference oracle; not used on the hot path):
+    - components are compared with fnmatchcase, as PurePosixPath.match does,
+      and '**' spans zero or more whole components.
+    - anchored: the pattern must match rel from its first component.
+    - unanchored: the pattern may start at any component boundary (suffix loop).
+    - trailing '/' or '/**' (directory rule): test every ancestor directory of rel
+      instead, so the rule covers the whole subtree (Dropbox semantics).
+    """
+    parts = rel_posix_lower.split("/")
+    dir_name = _dir_rule_name(pat2)
+    if dir_name is not None:
+        pat_parts = dir_name.split("/")
+        candidates = [parts[:k] for k in range(1, len(parts))]
+    else:
+        pat_parts = pat2.split("/")
+        candidates = [parts]
+    for cand in candidates:
+        if anchored:
+            if _match_parts(cand, pat_parts):
+                return True
+            continue
+        for i in range(len(cand)):
+            if _match_parts(cand[i:], pat_parts):
+                return True
     return False
 
 
-def _fast_match(rel_posix_lower: str, cr: CompiledRules) -> bool:
+def _fast_match(rel_posix_lower: AnyStr, cr: CompiledRules, sep: AnyStr) -> bool:
     """
     Fast "any rule matches" evaluation (valid only when cr.any_match_semantics=True).
+    Works on str with sep="/", or on ASCII-lowered bytes with cr.bytes_twin and
+    sep=b"/".
     """
     # Basename
     # (rel is already lower, and uses '/')
-    basename = rel_posix_lower.rsplit("/", 1)[-1]
+    basename = rel_posix_lower.rsplit(sep, 1)[-1]
 
     if basename in cr.basename_exact:
         return True
 
-    if cr.basename_prefix_dot_underscore and basename.startswith("._"):
-        return True
-    if cr.basename_prefix_dot_hash and basename.startswith(".#"):
-        return True
-    if cr.basename_endswith_tilde and basename.endswith("~"):
-        return True
-    if (
-        cr.basename_hash_wrapped
-        and basename.startswith("#")
-        and basename.endswith("#")
-        and len(basename) >= 2
-    ):
-        return True
-
-    for pre in cr.basename_prefix:
-        if basename.startswith(pre):
+    # name[:n] / name[-n:] for n > len(name) is the whole name, which can only be a
+    # key if the name itself is that (shorter) prefix/suffix: still a real hit.
+    for n in cr.basename_prefix_lens:
+        if basename[:n] in cr.basename_prefix:
             return True
-    for suf in cr.basename_suffix:
-        if basename.endswith(suf):
+    for n in cr.basename_suffix_lens:
+        if basename[-n:] in cr.basename_suffix:
             return True
+    if cr.basename_suffix_dotted:
+        j = basename.find(cr.dot)
+        while j >= 0:
+            if basename[j:] in cr.basename_suffix:
+                return True
+            j = basename.find(cr.dot, j + 1)
 
     # Directory components (exclude basename)
-    if (cr.dir_exact or cr.dir_prefix or cr.dir_suffix) and "/" in rel_posix_lower:
-        parts = rel_posix_lower.split("/")
+    if (cr.dir_exact or cr.dir_prefix or cr.dir_suffix) and sep in rel_posix_lower:
+        parts = rel_posix_lower.split(sep)
         dir_parts = parts[:-1]
         if cr.dir_exact:
             for part in dir_parts:
@@ -357,122 +746,281 @@ def _fast_match(rel_posix_lower: str, cr: CompiledRules) -> bool:
                     return True
         if cr.dir_prefix:
             for part in dir_parts:
-                for pre in cr.dir_prefix:
-                    if part.startswith(pre):
+                for n in cr.dir_prefix_lens:
+                    if part[:n] in cr.dir_prefix:
                         return True
         if cr.dir_suffix:
             for part in dir_parts:
-                for suf in cr.dir_suffix:
-                    if part.endswith(suf):
+                for n in cr.dir_suffix_lens:
+                    if part[-n:] in cr.dir_suffix:
                         return True
-
-    # Fallback rules (rare)
-    for r in cr.fallback:
-        if _trusted_match(rel_posix_lower, r.negated, r.anchored, r.pat2):
-            return True
+                if cr.dir_suffix_dotted:
+                    j = part.find(cr.dot)
+                    while j >= 0:
+                        if part[j:] in cr.dir_suffix:
+                            return True
+                        j = part.find(cr.dot, j + 1)
+
+    # Fallback rules (rare): one combined regex
+    if cr.fallback_re is not None and cr.fallback_re.match(rel_posix_lower):
+        return True
 
     return False
 
 
+def _regex_winner(
+    rx: Optional[re.Pattern[AnyStr]], group_rule: Tuple[int, ...], s: AnyStr
+) -> int:
+    if rx is None:
+        return -1
+    m = rx.match(s)
+    return -1 if m is None else group_rule[m.lastindex or 0]
+
+
+def _basename_last_match(basename: AnyStr, cr: CompiledRules) -> int:
+    # With cr.hot, any hit decides: return it without probing further.
+    best = cr.basename_exact.get(basename, -1)
+    if best >= 0 and cr.hot:
+        return best
+    for n in cr.basename_prefix_lens:
+        i = cr.basename_prefix.get(basename[:n], -1)
+        if i > best:
+            if cr.hot:
+                return i
+            best = i
+    for n in cr.basename_suffix_lens:
+        i = cr.basename_suffix.get(basename[-n:], -1)
+        if i > best:
+            if cr.hot:
+                return i
+            best = i
+    if cr.basename_suffix_dotted:
+        j = basename.find(cr.dot)
+        while j >= 0:
+            i = cr.basename_suffix.get(basename[j:], -1)
+            if i > best:
+                best = i
+            j = basename.find(cr.dot, j + 1)
+    return best
+
+
+def _component_last_match(part: AnyStr, cr: CompiledRules) -> int:
+    best = cr.dir_exact.get(part, -1)
+    if best >= 0 and cr.hot:
+        return best
+    for n in cr.dir_prefix_lens:
+        i = cr.dir_prefix.get(part[:n], -1)
+        if i > best:
+            if cr.hot:
+                return i
+            best = i
+    for n in cr.dir_suffix_lens:
+        i = cr.dir_suffix.get(part[-n:], -1)
+        if i > best:
+            if cr.hot:
+                return i
+            best = i
+    if cr.dir_suffix_dotted:
+        j = part.find(cr.dot)
+        while j >= 0:
+            i = cr.dir_suffix.get(part[j:], -1)
+            if i > best:
+                best = i
+            j = part.find(cr.dot, j + 1)
+    return best
+
+
+def _last_match(rel_posix_lower: AnyStr, cr: CompiledRules, sep: AnyStr) -> int:
+    """
+    Index of the last rule matching rel, or -1 (last-match-wins evaluation).
+    Buckets already store the highest rule index per key, so this is a max over
+    the same lookups as _fast_match; nothing is re-parsed per call.
+    """
+    best = _basename_last_match(rel_posix_lower.rsplit(sep, 1)[-1], cr)
+
+    if (cr.dir_exact or cr.dir_prefix or cr.dir_suffix) and sep in rel_posix_lower:
+        for part in rel_posix_lower.split(sep)[:-1]:
+            i = _component_last_match(part, cr)
+            if i > best:
+                best = i
+
+    i = _regex_winner(cr.fallback_re, cr.fallback_group_rule, rel_posix_lower)
+    return i if i > best else best
+
+
+def _dir_last_match(
+    name_lower: AnyStr, dir_rel_lower: AnyStr, cr: CompiledRules
+) -> int:
+    """Last directory rule matching this directory itself (ancestors not included)."""
+    best = _component_last_match(name_lower, cr)
+    if best >= 0 and cr.hot:
+        return best
+    i = _regex_winner(cr.fallback_dir_re, cr.fallback_dir_group_rule, dir_rel_lower)
+    return i if i > best else best
+
+
+def _file_last_match(
+    basename_lower: AnyStr, rel_lower: AnyStr, cr: CompiledRules
+) -> int:
+    """Last non-directory rule matching a file (its directories not included)."""
+    best = _basename_last_match(basename_lower, cr)
+    if best >= 0 and cr.hot:
+        return best
+    i = _regex_winner(cr.fallback_file_re, cr.fallback_file_group_rule, rel_lower)
+    return i if i > best else best
+
+
+def _subtree_ignored(winner: int, cr: CompiledRules) -> bool:
+    """True if a directory decided by rule `winner` is ignored with all its content."""
+    return winner > cr.last_negated and not cr.negated[winner]
+
+
+class DirVerdictCache:
+    """
+    Directory verdicts keyed by lowercase relative directory path: the highest index
+    of the directory rules matching that directory or any of its ancestors (-1 if
+    none). An entry is derived from its parent's, so each directory is evaluated
+    once and sibling files share it. Works on str or bytes keys (cr/sep must match).
+
+    Bounded: when full it is simply cleared, since `find` emits each directory's
+    files together and the entries are cheap to rebuild from the ancestors.
+    """
+
+    def __init__(self, cr: CompiledRules, sep: AnyStr, maxsize: int = 1 << 16):
+        self.cr = cr
+        self.sep = sep
+        self.maxsize = maxsize
+        self._root = sep[:0]
+        self._verdicts = {self._root: -1}
+
+    def get(self, dir_rel_lower: AnyStr) -> int:
+        w = self._verdicts.get(dir_rel_lower)
+        if w is not None:
+            return w
+        i = dir_rel_lower.rfind(self.sep)
+        parent = dir_rel_lower[:i] if i >= 0 else self._root
+        inherited = self.get(parent)
+        w = _dir_last_match(dir_rel_lower[i + 1 :], dir_rel_lower, self.cr)
+        if w < inherited:
+            w = inherited
+        if len(self._verdicts) >= self.maxsize:
+            self._verdicts.clear()
+            self._verdicts[self._root] = -1
+        self._verdicts[dir_rel_lower] = w
+        return w
+
+
+def _is_ignored_cached(rel_lower: AnyStr, cache: DirVerdictCache) -> bool:
+    """
+    is_ignored for a lowered path (str, or bytes with a bytes_twin cache): one
+    cache lookup for the parent directory, then the basename/file tests only.
+    """
+    cr = cache.cr
+    i = rel_lower.rfind(cache.sep)
+    if i < 0:
+        w = _file_last_match(rel_lower, rel_lower, cr)
+    else:
+        w = cache.get(rel_lower[:i])
+        if w >= 0 and _subtree_ignored(w, cr):
+            return True
+        fw = _file_last_match(rel_lower[i + 1 :], rel_lower, cr)
+        if fw > w:
+            w = fw
+    return w >= 0 and not cr.negated[w]
+
+
 def is_ignored(rel_posix: str, cr: CompiledRules) -> bool:
     """
-    If no negations/anchored rules exist: short-circuit on first match (fast).
-    Otherwise: preserve last-match-wins semantics using trusted matcher for all rules
-    (still benefits from fast-path checks before fallback).
+    If no negations exist: short-circuit on first match (fast).
+    Otherwise: last-match-wins, i.e. the verdict of the highest-index rule hit,
+    evaluated on the same precompiled buckets.
     """
     rel_l = rel_posix.lower()
 
     if cr.any_match_semantics:
-        return _fast_match(rel_l, cr)
-
-    # Full semantics: last-match-wins.
-    ignored = False
-    # We can still evaluate fast predicates to detect matches cheaply, but we must
-    # do it in order and allow later rules to override, so we cannot short-circuit.
-    basename = rel_l.rsplit("/", 1)[-1]
-    parts = rel_l.split("/") if "/" in rel_l else [rel_l]
-    dir_parts = parts[:-1]
-
-    for neg, anchored, pat2 in cr.ordered_raw:
-        matched = False
-
-        # Attempt fast classification again based on the textual pattern form.
-        # If we cannot classify the pattern safely, fall back to trusted matcher.
-        # NOTE: This path is mainly for completeness; in your simplified rules
-        # any_match_semantics should be True.
-        if not anchored and pat2.startswith("**/"):
-            tail = pat2[3:]
-            if tail.endswith("/**") and "/" not in tail[:-3]:
-                name = tail[:-3]
-                if not _has_glob_meta(name):
-                    matched = name in dir_parts
-                elif name.endswith("*") and not _has_glob_meta(name[:-1]):
-                    pre = name[:-1]
-                    matched = any(p.startswith(pre) for p in dir_parts)
-                elif name.startswith("*.") and not _has_glob_meta(name[1:]):
-                    suf = name[1:]
-                    matched = any(p.endswith(suf) for p in dir_parts)
-                else:
-                    matched = _trusted_match(rel_l, neg, anchored, pat2)
-            elif "/" not in tail:
-                name = tail
-                if name == "*~":
-                    matched = basename.endswith("~")
-                elif name == "#*#":
-                    matched = (
-                        basename.startswith("#")
-                        and basename.endswith("#")
-                        and len(basename) >= 2
-                    )
-                elif name == "._*":
-                    matched = basename.startswith("._")
-                elif name == ".#*":
-                    matched = basename.startswith(".#")
-                elif name.endswith(".*") and not _has_glob_meta(name[:-2]):
-                    matched = basename.startswith(name[:-1])
-                elif not _has_glob_meta(name):
-                    matched = basename == name
-                elif name.startswith("*.") and not _has_glob_meta(name[1:]):
-                    matched = basename.endswith(name[1:])
-                elif name.endswith("*") and not _has_glob_meta(name[:-1]):
-                    matched = basename.startswith(name[:-1])
-                else:
-                    matched = _trusted_match(rel_l, neg, anchored, pat2)
-            else:
-                matched = _trusted_match(rel_l, neg, anchored, pat2)
-        else:
-            matched = _trusted_match(rel_l, neg, anchored, pat2)
+        return _fast_match(rel_l, cr, "/")
 
-        if matched:
-            ignored = not neg
+    winner = _last_match(rel_l, cr, "/")
+    return winner >= 0 and not cr.negated[winner]
 
-    return ignored
+
+def matching_rule(rel_posix: str, cr: CompiledRules) -> int:
+    """
+    Index of the rule that decides rel's verdict, or -1 (last-match-wins, as the
+    walker evaluates it). A trailing '/' marks a directory.
+    """
+    rel_l = rel_posix.lower()
+    is_dir = rel_l.endswith("/")
+    parts = rel_l.rstrip("/").split("/")
+    best = -1
+    prefix = ""
+    for part in parts if is_dir else parts[:-1]:
+        prefix = prefix + "/" + part if prefix else part
+        i = _dir_last_match(part, prefix, cr)
+        if i > best:
+            best = i
+    if not is_dir:
+        i = _file_last_match(parts[-1], rel_l, cr)
+        if i > best:
+            best = i
+    return best
+
+
+def bytes_dir_cache(cr: CompiledRules) -> DirVerdictCache:
+    """Directory verdict cache for ASCII paths matched as bytes."""
+    return DirVerdictCache(cr.bytes_twin, b"/")
 
 
 # -----------------------------
-# find enumeration
+# Enumeration: find / scandir walker
 # -----------------------------
 
+# Top-level entries managed by the Dropbox client itself; the walker skips them.
+DROPBOX_INTERNAL_DIRS = frozenset({".dropbox", ".dropbox.cache"})
+
 
 def _run_find_print0(root: Path) -> subprocess.Popen[bytes]:
     cmd = ["find", str(root.resolve()), "-type", "f", "-print0"]
     return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=None)
 
 
-def iter_files_find(root: Path) -> Iterator[str]:
-    proc = _run_find_print0(root)
+def _run_find_sized(root: Path) -> subprocess.Popen[bytes]:
+    """Like _run_find_print0, but every record is '<size> <path>' (GNU find)."""
+    cmd = ["find", str(root.resolve()), "-type", "f", "-printf", "%s %p\\0"]
+    return subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=None)
+
+
+@lru_cache(maxsize=None)
+def find_has_printf() -> bool:
+    """GNU find reports sizes itself; busybox/BSD find need an lstat per match."""
+    try:
+        rc = subprocess.run(
+            ["find", "/", "-maxdepth", "0", "-printf", ""],
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        ).returncode
+    except OSError:
+        return False
+    return rc == 0
+
+
+def iter_chunks_find(root: Path, sized: bool = False) -> Iterator[bytes]:
+    """
+    Raw `find` output in ~1 MiB chunks cut after a NUL (whole records):
+    '<path>\\0' records, or '<size> <path>\\0' with sized=True.
+    """
+    proc = _run_find_sized(root) if sized else _run_find_print0(root)
     assert proc.stdout is not None
-    buf = b""
+    rest = b""
     for chunk in iter(lambda: proc.stdout.read(1 << 20), b""):
-        buf += chunk
-        while True:
-            i = buf.find(b"\0")
-            if i < 0:
-                break
-            raw = buf[:i]
-            buf = buf[i + 1 :]
-            if raw:
-                yield raw.decode("utf-8", errors="surrogateescape")
+        if rest:
+            chunk = rest + chunk
+        i = chunk.rfind(b"\0") + 1
+        rest = chunk[i:]
+        if i:
+            yield chunk[:i]
+    if rest:
+        yield rest + b"\0"
     rc = proc.wait()
     if rc != 0:
         raise RuntimeError(f"find exited with code {rc}")
@@ -490,132 +1038,2391 @@ def count_files_find(root: Path) -> int:
     return total
 
 
-# -----------------------------
-# Core
-# -----------------------------
+class FileCounter(threading.Thread):
+    """
+    Counts the files below root with `find` in the background, so a progress bar
+    gets its total while the scan runs instead of after an extra pass.
+    """
 
+    def __init__(self, root: Path) -> None:
+        super().__init__(name="count-files", daemon=True)
+        self.root = root
+        self.count = 0
+        self._proc: Optional[subprocess.Popen[bytes]] = None
 
-@dataclass
-class Match:
-    path: Path
-    rel: str
-    size: int
+    def run(self) -> None:
+        self._proc = proc = _run_find_print0(self.root)
+        assert proc.stdout is not None
+        for chunk in iter(lambda: proc.stdout.read(1 << 20), b""):
+            self.count += chunk.count(b"\0")
+        proc.wait()
 
+    def stop(self) -> None:
+        if self._proc is not None and self._proc.poll() is None:
+            self._proc.kill()
 
-def human_bytes(n: int) -> str:
-    units = ["B", "KiB", "MiB", "GiB", "TiB", "PiB"]
-    x = float(n)
-    for u in units:
-        if x < 1024 or u == units[-1]:
-            return f"{x:.2f} {u}" if u != "B" else f"{int(x)} {u}"
-        x /= 1024.0
-    return f"{n} B"
 
+def _cache_path(list_out: Path, kind: str = "count") -> Path:
+    """Where state of the last scan (file count, rule stats) is kept: by the list."""
+    if str(list_out) == "-":
+        cache = Path(os.environ.get("XDG_CACHE_HOME") or "~/.cache").expanduser()
+        return cache / "cleanup_dropbox_ignored" / f"last_{kind}.json"
+    return list_out.with_name(f"{list_out.name}.{kind}.json")
 
-def ensure_outside_dropbox(dest: Path, root: Path) -> None:
-    dest = dest.resolve()
-    root = root.resolve()
-    try:
-        dest.relative_to(root)
-    except ValueError:
-        return
-    raise ValueError(f"--move-to must be outside Dropbox root ({root}); got {dest}")
 
+def load_previous_count(list_out: Path, root: Path) -> Optional[int]:
+    """Files scanned below root by the previous run, if recorded."""
+    try:
+        data = json.loads(_cache_path(list_out).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    files = data.get("files") if data.get("root") == str(root) else None
+    return files if isinstance(files, int) and files > 0 else None
 
-def collect_matches(
-    root: Path,
-    rules_path: Path,
-    list_out: Path,
-    progress: bool,
-    count_first: bool,
-    progress_every: int,
-) -> Tuple[list[Match], int, int]:
-    cr = compile_rules(rules_path)
 
-    if cr.any_match_semantics:
-        LOG.debug(
-            "Compiled rules from %s: any-match semantics enabled "
-            "(no negations, no anchored rules).",
-            rules_path,
-        )
-    else:
-        LOG.debug(
-            "Compiled rules from %s: full semantics (negations/anchored present).",
-            rules_path,
-        )
+def save_count(list_out: Path, root: Path, files: int) -> None:
+    path = _cache_path(list_out)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps({"root": str(root), "files": files}), "utf-8")
+    except OSError as e:
+        LOG.debug("Cannot record file count in %s: %s", path, e)
+
+
+def _tree_size(path: str) -> Tuple[int, int]:
+    """(files, bytes) below path, du-style: no matching, no relative paths."""
+    files = total = 0
+    stack = [path]
+    while stack:
+        d = stack.pop()
+        try:
+            it = os.scandir(d)
+        except OSError as e:
+            LOG.warning("Cannot list %s: %s", d, e)
+            continue
+        with it:
+            for e in it:
+                try:
+                    if e.is_dir(follow_symlinks=False):
+                        stack.append(e.path)
+                    elif e.is_file(follow_symlinks=False):
+                        files += 1
+                        total += e.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+    return files, total
 
-    LOG.debug(
-        "Fast buckets: basename_exact=%d, basename_prefix=%d, basename_suffix=%d, "
-        "dir_exact=%d, dir_prefix=%d, dir_suffix=%d, fallback=%d",
-        len(cr.basename_exact),
-        len(cr.basename_prefix),
-        len(cr.basename_suffix),
-        len(cr.dir_exact),
-        len(cr.dir_prefix),
-        len(cr.dir_suffix),
-        len(cr.fallback),
-    )
 
-    root = root.resolve()
-    root_str = str(root)
+# (abs path, rel path, rel path lower, inherited directory verdict)
+_DirItem = Tuple[str, str, str, int]
 
-    total_files: Optional[int] = None
-    if progress and count_first:
-        LOG.info("Counting files for determinate progress total (extra find pass)...")
-        total_files = count_files_find(root)
-        LOG.info("Found %d files.", total_files)
 
-    pbar = maybe_tqdm(progress, total_files, desc="match")
+def _scan_dir(
+    item: _DirItem, cr: CompiledRules, size_collapsed: bool = True
+) -> Tuple[int, list[Match], list[_DirItem]]:
+    """
+    List one directory: (files scanned, matches, subdirectories to visit).
 
-    matches: list[Match] = []
-    total_size = 0
+    Directory rules are evaluated once per directory and inherited by its content.
+    A directory whose verdict no later negation can override is not descended into
+    for matching: it is reported as one collapsed entry (rel ending in '/') with
+    the summed size of its files. With size_collapsed=False such entries are
+    returned unsized (size 0, files not counted) for the caller to measure.
+    """
+    dir_abs, dir_rel, dir_rel_l, inherited = item
     scanned = 0
+    found: list[Match] = []
+    subdirs: list[_DirItem] = []
+    try:
+        it = os.scandir(dir_abs)
+    except OSError as e:
+        LOG.warning("Cannot list %s: %s", dir_abs, e)
+        return scanned, found, subdirs
+    with it:
+        for e in it:
+            name = e.name
+            name_l = name.lower()
+            rel = dir_rel + "/" + name if dir_rel else name
+            rel_l = dir_rel_l + "/" + name_l if dir_rel else name_l
+            try:
+                if e.is_dir(follow_symlinks=False):
+                    if not dir_rel and name_l in DROPBOX_INTERNAL_DIRS:
+                        continue
+                    w = _dir_last_match(name_l, rel_l, cr)
+                    if w < inherited:
+                        w = inherited
+                    if w >= 0 and _subtree_ignored(w, cr):
+                        if not size_collapsed:
+                            found.append(
+                                Match(
+                                    path=Path(e.path),
+                                    rel=rel + "/",
+                                    size=0,
+                                    is_dir=True,
+                                )
+                            )
+                            continue
+                        n, size = _tree_size(e.path)
+                        scanned += n
+                        if n:
+                            found.append(
+                                Match(
+                                    path=Path(e.path),
+                                    rel=rel + "/",
+                                    size=size,
+                                    is_dir=True,
+                                )
+                            )
+                    else:
+                        subdirs.append((e.path, rel, rel_l, w))
+                    continue
+                if not e.is_file(follow_symlinks=False):
+                    continue
+                scanned += 1
+                if rel_l == "rules.dropboxignore":
+                    continue
+                w = _file_last_match(name_l, rel_l, cr)
+                if w < inherited:
+                    w = inherited
+                if w >= 0 and not cr.negated[w]:
+                    st = e.stat(follow_symlinks=False)
+                    found.append(
+                        Match(path=Path(e.path), rel=rel, size=int(st.st_size))
+                    )
+            except FileNotFoundError:
+                continue
+    return scanned, found, subdirs
 
-    t0 = time.time()
-    for abs_s in iter_files_find(root):
-        scanned += 1
-        rel = os.path.relpath(abs_s, root_str).replace(os.sep, "/")
 
-        if progress_every and scanned % progress_every == 0:
-            LOG.info("Scanned %d files; matches so far: %d", scanned, len(matches))
+def iter_batches_scandir(
+    root: Path, cr: CompiledRules
+) -> Iterator[Tuple[int, list[Match]]]:
+    """Walk root with os.scandir, yielding (files scanned, matches) per directory."""
+    stack: list[_DirItem] = [(str(root.resolve()), "", "", -1)]
+    while stack:
+        scanned, found, subdirs = _scan_dir(stack.pop(), cr)
+        stack.extend(subdirs)
+        yield scanned, found
 
-        if rel.lower() == "rules.dropboxignore":
-            if pbar is not None:
-                pbar.update(1)
-            continue
 
-        if is_ignored(rel, cr):
-            p = Path(abs_s)
+def iter_batches_parallel(
+    root: Path, cr: CompiledRules, jobs: int
+) -> Iterator[Tuple[int, list[Match]]]:
+    """
+    Same batches as iter_batches_scandir, with directory reads spread over `jobs`
+    threads (os.scandir releases the GIL while it waits on the filesystem).
+
+    Work stealing: each worker pushes the subdirectories it finds onto its own
+    deque and pops from its tail (depth-first, good locality); an idle worker
+    steals from the head of another worker's deque (large, shallow subtrees).
+    Batch order depends on scheduling; callers sort the matches.
+    """
+    deques: list[deque[_DirItem]] = [deque() for _ in range(jobs)]
+    deques[0].append((str(root.resolve()), "", "", -1))
+    pending = [1]  # directories queued or being scanned
+    cv = threading.Condition()
+    stop = threading.Event()
+    out: queue.SimpleQueue[object] = queue.SimpleQueue()
+
+    def take(k: int) -> Optional[_DirItem]:
+        try:
+            return deques[k].pop()
+        except IndexError:
+            pass
+        for j in range(1, jobs):
             try:
-                st = p.lstat()
-            except FileNotFoundError:
-                if pbar is not None:
-                    pbar.update(1)
+                return deques[(k + j) % jobs].popleft()
+            except IndexError:
                 continue
-            if os.stat.S_ISREG(st.st_mode):
-                size = int(st.st_size)
-                total_size += size
-                matches.append(Match(path=p, rel=rel, size=size))
+        return None
 
-        if pbar is not None:
-            pbar.update(1)
+    def worker(k: int) -> None:
+        try:
+            while not stop.is_set():
+                item = take(k)
+                if item is None:
+                    with cv:
+                        if pending[0] == 0:
+                            return
+                        cv.wait(0.05)
+                    continue
+                scanned, found, subdirs = _scan_dir(item, cr)
+                with cv:
+                    # Publish children before retiring this directory, so pending
+                    # never drops to zero while work is still queued.
+                    pending[0] += len(subdirs) - 1
+                    deques[k].extend(subdirs)
+                    cv.notify_all()
+                out.put((scanned, found))
+        except BaseException as e:  # surfaced in the consumer
+            out.put(e)
+            stop.set()
+            with cv:
+                cv.notify_all()
+        finally:
+            out.put(None)
+
+    threads = [
+        threading.Thread(target=worker, args=(k,), name=f"scan-{k}", daemon=True)
+        for k in range(jobs)
+    ]
+    for t in threads:
+        t.start()
+    try:
+        running = jobs
+        while running:
+            res = out.get()
+            if res is None:
+                running -= 1
+            elif isinstance(res, BaseException):
+                raise res
+            else:
+                yield res  # type: ignore[misc]
+    finally:
+        stop.set()
+        with cv:
+            cv.notify_all()
+        for t in threads:
+            t.join()
 
-    if pbar is not None:
-        pbar.close()
 
-    matches.sort(key=lambda m: m.size, reverse=True)
-    list_out.parent.mkdir(parents=True, exist_ok=True)
-    list_out.write_text("".join(m.rel + "\n" for m in matches), encoding="utf-8")
+# -----------------------------
+# Incremental scan index
+# -----------------------------
 
-    elapsed = max(1e-9, time.time() - t0)
-    LOG.info(
-        "Scanned %d files in %.1fs (%.0f files/s).",
-        scanned,
-        elapsed,
-        scanned / elapsed,
-    )
+INDEX_FORMAT = 1
 
-    return matches, total_size, scanned
+
+class ScanIndex:
+    """
+    Per-directory cache of the scandir walker, kept in an SQLite file.
+
+    Each directory is stored with its (mtime, inode) and what listing it produced:
+    a directory whose mtime and inode are unchanged since the last run is not
+    listed again. The whole index is discarded when the rules or the root change.
+    Directory mtimes do not move when a file is rewritten in place, so such a file
+    keeps its previous size until something is added, removed or renamed next to it.
+    """
+
+    def __init__(self, path: Path, root: Path, cr: CompiledRules) -> None:
+        self.path = path
+        self.key = hashlib.sha256(
+            json.dumps([INDEX_FORMAT, str(root), cr.ordered_raw]).encode()
+        ).hexdigest()
+        # rel -> (mtime_ns, ino, kind, payload json); old is read, new is written.
+        self._old: dict[str, Tuple[int, int, str, str]] = {}
+        self._new: dict[str, Tuple[int, int, str, str]] = {}
+        self.reused = 0
+        self.listed = 0
+        self._load()
+
+    def _connect(self) -> sqlite3.Connection:
+        con = sqlite3.connect(self.path)
+        con.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT NOT NULL)")
+        con.execute(
+            "CREATE TABLE IF NOT EXISTS dirs (rel BLOB PRIMARY KEY, "
+            "mtime_ns INTEGER, ino INTEGER, kind TEXT, payload TEXT)"
+        )
+        return con
+
+    def _load(self) -> None:
+        if not self.path.exists():
+            return
+        try:
+            con = self._connect()
+            try:
+                row = con.execute("SELECT key FROM meta").fetchone()
+                if row is None or row[0] != self.key:
+                    LOG.info(
+                        "Scan index %s was built for other rules; rebuilding.",
+                        self.path,
+                    )
+                    return
+                for rel, mtime_ns, ino, kind, payload in con.execute(
+                    "SELECT rel, mtime_ns, ino, kind, payload FROM dirs"
+                ):
+                    self._old[os.fsdecode(rel)] = (mtime_ns, ino, kind, payload)
+            finally:
+                con.close()
+        except sqlite3.Error as e:
+            LOG.warning("Ignoring unreadable scan index %s: %s", self.path, e)
+            self._old.clear()
+
+    def lookup(self, rel: str, kind: str, st: os.stat_result) -> Optional[dict]:
+        """Cached payload of directory rel if it has not changed, else None."""
+        row = self._old.get(rel)
+        if (
+            row is None
+            or row[0] != st.st_mtime_ns
+            or row[1] != st.st_ino
+            or row[2] != kind
+        ):
+            return None
+        self._new[rel] = row
+        self.reused += 1
+        return json.loads(row[3])
+
+    def store(self, rel: str, kind: str, st: os.stat_result, payload: dict) -> None:
+        self._new[rel] = (st.st_mtime_ns, st.st_ino, kind, json.dumps(payload))
+        self.listed += 1
+
+    def save(self) -> None:
+        """Replace the file's content with the directories seen by this run."""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        con = self._connect()
+        try:
+            with con:
+                con.execute("DELETE FROM meta")
+                con.execute("INSERT INTO meta (key) VALUES (?)", (self.key,))
+                con.execute("DELETE FROM dirs")
+                con.executemany(
+                    "INSERT INTO dirs VALUES (?, ?, ?, ?, ?)",
+                    ((os.fsencode(rel), *row) for rel, row in self._new.items()),
+                )
+        finally:
+            con.close()
+
+
+def _tree_size_indexed(path: str, rel: str, index: ScanIndex) -> Tuple[int, int]:
+    """_tree_size reusing the index for directories whose mtime is unchanged."""
+    files = total = 0
+    stack = [(path, rel)]
+    while stack:
+        d, d_rel = stack.pop()
+        try:
+            st = os.lstat(d)
+        except OSError as e:
+            LOG.warning("Cannot stat %s: %s", d, e)
+            continue
+        payload = index.lookup(d_rel, "du", st)
+        if payload is None:
+            n = size = 0
+            names: list[str] = []
+            try:
+                with os.scandir(d) as it:
+                    for e in it:
+                        try:
+                            if e.is_dir(follow_symlinks=False):
+                                names.append(e.name)
+                            elif e.is_file(follow_symlinks=False):
+                                n += 1
+                                size += e.stat(follow_symlinks=False).st_size
+                        except OSError:
+                            continue
+            except OSError as e:
+                LOG.warning("Cannot list %s: %s", d, e)
+                continue
+            payload = {"n": n, "b": size, "d": names}
+            index.store(d_rel, "du", st, payload)
+        files += payload["n"]
+        total += payload["b"]
+        stack.extend((d + "/" + name, d_rel + "/" + name) for name in payload["d"])
+    return files, total
+
+
+def iter_batches_indexed(
+    root: Path, cr: CompiledRules, index: ScanIndex
+) -> Iterator[Tuple[int, list[Match]]]:
+    """
+    iter_batches_scandir backed by a ScanIndex: unchanged directories are replayed
+    from the index instead of being listed and matched again.
+    """
+    stack: list[_DirItem] = [(str(root.resolve()), "", "", -1)]
+    while stack:
+        item = stack.pop()
+        dir_abs, dir_rel, dir_rel_l, _ = item
+        try:
+            st = os.lstat(dir_abs)
+        except OSError as e:
+            LOG.warning("Cannot stat %s: %s", dir_abs, e)
+            continue
+        payload = index.lookup(dir_rel, "scan", st)
+        if payload is None:
+            scanned, found, subdirs = _scan_dir(item, cr, size_collapsed=False)
+            payload = {
+                "n": scanned,
+                "m": [[m.path.name, m.size, m.is_dir] for m in found],
+                "d": [[os.path.basename(s[0]), s[3]] for s in subdirs],
+            }
+            index.store(dir_rel, "scan", st, payload)
+        else:
+            scanned = payload["n"]
+            found = [
+                Match(
+                    path=Path(dir_abs + "/" + name),
+                    rel=(dir_rel + "/" + name if dir_rel else name)
+                    + ("/" if is_dir else ""),
+                    size=size,
+                    is_dir=is_dir,
+                )
+                for name, size, is_dir in payload["m"]
+            ]
+            subdirs = []
+            for name, w in payload["d"]:
+                rel = dir_rel + "/" + name if dir_rel else name
+                rel_l = dir_rel_l + "/" + name.lower() if dir_rel else name.lower()
+                subdirs.append((dir_abs + "/" + name, rel, rel_l, w))
+        sized: list[Match] = []
+        for m in found:
+            if m.is_dir:
+                n, size = _tree_size_indexed(str(m.path), m.rel[:-1], index)
+                scanned += n
+                if not n:
+                    continue
+                m = replace(m, size=size)
+            sized.append(m)
+        stack.extend(subdirs)
+        yield scanned, sized
+
+
+# -----------------------------
+# find output matching (bytes records)
+# -----------------------------
+
+# (files scanned, [(start, end, size)]: byte offsets of the matches in the chunk)
+_ChunkResult = Tuple[int, list[Tuple[int, int, int]]]
+
+
+def _root_prefix(root: Path) -> bytes:
+    """Byte prefix `find` puts before every relative path below root."""
+    return os.fsencode(str(root.resolve()).rstrip("/") + "/")
+
+
+# Threads used to lstat matches when find cannot report sizes (per process).
+_STAT_THREADS = 16
+_STAT_POOL: Optional[Tuple[int, ThreadPoolExecutor]] = None
+
+
+def _stat_pool() -> ThreadPoolExecutor:
+    global _STAT_POOL
+    # Keyed by pid: a pool inherited through fork (process-pool workers) is unusable.
+    if _STAT_POOL is None or _STAT_POOL[0] != os.getpid():
+        _STAT_POOL = (os.getpid(), ThreadPoolExecutor(_STAT_THREADS, "lstat"))
+    return _STAT_POOL[1]
+
+
+def _fill_sizes(
+    chunk: bytes, hits: list[Tuple[int, int, int]]
+) -> list[Tuple[int, int, int]]:
+    """lstat the hits of a chunk concurrently; vanished files are dropped."""
+
+    def size_of(hit: Tuple[int, int, int]) -> int:
+        try:
+            return os.lstat(chunk[hit[0] : hit[1]]).st_size
+        except FileNotFoundError:
+            return -1
+
+    sizes = _stat_pool().map(size_of, hits)
+    return [(a, b, size) for (a, b, _), size in zip(hits, sizes) if size >= 0]
+
+
+def _match_records(
+    chunk: bytes,
+    cr: CompiledRules,
+    root_prefix: bytes,
+    cache: DirVerdictCache,
+    sized: bool,
+) -> _ChunkResult:
+    """
+    Match every NUL-terminated absolute path of a chunk without building strings:
+    records are located with bytes.find (the buffer is never re-sliced), the root
+    prefix is skipped by offset, and ASCII paths are lowered and matched as bytes
+    against the directory verdict cache (see bytes_dir_cache).
+    Only non-ASCII paths (str case folding) fall back to is_ignored.
+
+    With sized=True, records are '<size> <path>' and sizes come from find itself
+    (-type f already restricted them to regular files); otherwise their sizes are
+    -1 and the caller lstats them (_fill_sizes).
+    """
+    off = len(root_prefix)
+    find = chunk.find
+    n = len(chunk)
+    scanned = 0
+    hits: list[Tuple[int, int, int]] = []
+    start = 0
+    while start < n:
+        end = find(b"\0", start)
+        if end < 0:
+            end = n
+        if end > start:
+            scanned += 1
+            path_start = find(b" ", start, end) + 1 if sized else start
+            rel = chunk[path_start + off : end]
+            if rel.isascii():
+                rel_l = rel.lower()
+                hit = rel_l != b"rules.dropboxignore" and _is_ignored_cached(
+                    rel_l, cache
+                )
+            else:
+                hit = is_ignored(rel.decode("utf-8", errors="surrogateescape"), cr)
+            if hit:
+                size = int(chunk[start : path_start - 1]) if sized else -1
+                hits.append((path_start, end, size))
+        start = end + 1
+    return scanned, hits
+
+
+def _records_to_matches(
+    chunk: bytes, hits: list[Tuple[int, int, int]], root_prefix: bytes
+) -> list[Match]:
+    """Decode only the matched records of a chunk."""
+    off = len(os.fsdecode(root_prefix))
+    found = []
+    for start, end, size in hits:
+        abs_s = chunk[start:end].decode("utf-8", errors="surrogateescape")
+        found.append(Match(path=Path(abs_s), rel=abs_s[off:], size=size))
+    return found
+
+
+def iter_batches_find(
+    root: Path, cr: CompiledRules, metrics: Optional[Metrics] = None
+) -> Iterator[Tuple[int, list[Match]]]:
+    """
+    `find -print0` output matched in-process, yielding (files scanned, matches).
+    With metrics, each chunk's enumerate/match/stat/normalize time is accounted.
+    """
+    root_prefix = _root_prefix(root)
+    cache = bytes_dir_cache(cr)
+    sized = find_has_printf()
+    chunks = iter_chunks_find(root, sized)
+    clock = time.perf_counter
+    while True:
+        t0 = clock()
+        chunk = next(chunks, None)
+        if chunk is None:
+            return
+        t1 = clock()
+        scanned, hits = _match_records(chunk, cr, root_prefix, cache, sized)
+        t2 = clock()
+        if hits and not sized:
+            hits = _fill_sizes(chunk, hits)
+        t3 = clock()
+        found = _records_to_matches(chunk, hits, root_prefix)
+        if metrics is not None:
+            metrics.add("enumerate", t1 - t0, scanned)
+            metrics.add("match", t2 - t1, scanned)
+            if not sized:
+                metrics.add("stat", t3 - t2, len(hits))
+            metrics.add("normalize", clock() - t3, len(found))
+        yield scanned, found
+
+
+# -----------------------------
+# Process-pool matching
+# -----------------------------
+
+# Per-worker state, set once by _pool_init:
+# (rules, root prefix, verdict cache, sized find records).
+_WORKER_STATE: Optional[Tuple[CompiledRules, bytes, DirVerdictCache, bool]] = None
+
+
+def _pool_init(cr: CompiledRules, root_prefix: bytes, sized: bool) -> None:
+    global _WORKER_STATE
+    _WORKER_STATE = (cr, root_prefix, bytes_dir_cache(cr), sized)
+
+
+def _match_chunk(chunk: bytes) -> _ChunkResult:
+    """Worker side of _match_records: only the offsets of the hits travel back."""
+    assert _WORKER_STATE is not None
+    cr, root_prefix, cache, sized = _WORKER_STATE
+    scanned, hits = _match_records(chunk, cr, root_prefix, cache, sized)
+    if hits and not sized:
+        hits = _fill_sizes(chunk, hits)
+    return scanned, hits
+
+
+def iter_batches_procs(
+    root: Path, cr: CompiledRules, procs: int, metrics: Optional[Metrics] = None
+) -> Iterator[Tuple[int, list[Match]]]:
+    """
+    `find -print0` chunks matched by a pool of `procs` processes, yielding
+    (files scanned, matches) per chunk in find order. The rules are shipped to
+    each worker once; at most 2 * procs chunks are in flight. With metrics,
+    "match" is the time spent waiting for the workers (their stat included).
+    """
+    root_prefix = _root_prefix(root)
+    sized = find_has_printf()
+    with ProcessPoolExecutor(
+        max_workers=procs, initializer=_pool_init, initargs=(cr, root_prefix, sized)
+    ) as ex:
+        inflight: deque[Tuple[bytes, Future[_ChunkResult]]] = deque()
+
+        def merge_oldest() -> Tuple[int, list[Match]]:
+            chunk, fut = inflight.popleft()
+            t0 = time.perf_counter()
+            scanned, hits = fut.result()
+            t1 = time.perf_counter()
+            found = _records_to_matches(chunk, hits, root_prefix)
+            if metrics is not None:
+                metrics.add("match", t1 - t0, scanned)
+                metrics.add("normalize", time.perf_counter() - t1, len(found))
+            return scanned, found
+
+        chunks = iter_chunks_find(root, sized)
+        if metrics is not None:
+            chunks = _timed_chunks(chunks, metrics)
+        for chunk in chunks:
+            inflight.append((chunk, ex.submit(_match_chunk, chunk)))
+            if len(inflight) >= 2 * procs:
+                yield merge_oldest()
+        while inflight:
+            yield merge_oldest()
+
+
+# -----------------------------
+# Core
+# -----------------------------
+
+
+@dataclass(slots=True)
+class Match:
+    path: Path
+    rel: str
+    size: int
+    is_dir: bool = False  # collapsed ignored directory (rel ends with '/')
+
+
+class MatchStore:
+    """
+    Columnar match storage: relative paths packed in one bytearray (UTF-8,
+    surrogateescape, delimited by an offsets array), sizes in array('Q'),
+    directory flags in a bytearray. Match objects, with their Path, are only
+    built when an entry is read, so millions of matches cost a few dozen bytes
+    each.
+    """
+
+    def __init__(self, root: Path) -> None:
+        self.root = str(root)
+        self._paths = bytearray()
+        self._offsets = array("Q", [0])
+        self._sizes = array("Q")
+        self._dirs = bytearray()
+        self._order: Optional[array[int]] = None
+
+    def append(self, m: Match) -> None:
+        self._paths += m.rel.encode("utf-8", "surrogateescape")
+        self._offsets.append(len(self._paths))
+        self._sizes.append(m.size)
+        self._dirs.append(m.is_dir)
+        self._order = None
+
+    def extend(self, found: list[Match]) -> None:
+        for m in found:
+            self.append(m)
+
+    def __len__(self) -> int:
+        return len(self._sizes)
+
+    def _path_bytes(self, i: int) -> bytearray:
+        return self._paths[self._offsets[i] : self._offsets[i + 1]]
+
+    def _rel(self, i: int) -> str:
+        return self._path_bytes(i).decode("utf-8", "surrogateescape")
+
+    def sort(self) -> None:
+        """Order by size, largest first, ties by path (sorts indices only)."""
+        sizes = self._sizes
+        order = sorted(range(len(sizes)), key=sizes.__getitem__, reverse=True)
+        # Path keys are built one equal-size run at a time to bound their memory.
+        i, n = 0, len(order)
+        while i < n:
+            size = sizes[order[i]]
+            j = i + 1
+            while j < n and sizes[order[j]] == size:
+                j += 1
+            if j - i > 1:
+                order[i:j] = sorted(order[i:j], key=self._path_bytes)
+            i = j
+        self._order = array("Q", order)
+
+    def _index(self, k: int) -> int:
+        return self._order[k] if self._order is not None else k
+
+    def entries(self) -> Iterator[Tuple[str, int, bool]]:
+        """(rel, size, is_dir) in order, without building Match objects."""
+        for k in range(len(self)):
+            i = self._index(k)
+            yield self._rel(i), self._sizes[i], bool(self._dirs[i])
+
+    def __getitem__(self, k: int) -> Match:
+        i = self._index(k)
+        rel = self._rel(i)
+        return Match(
+            path=Path(os.path.join(self.root, rel)),
+            rel=rel,
+            size=self._sizes[i],
+            is_dir=bool(self._dirs[i]),
+        )
+
+    def __iter__(self) -> Iterator[Match]:
+        for k in range(len(self)):
+            yield self[k]
+
+
+def human_bytes(n: int) -> str:
+    units = ["B", "KiB", "MiB", "GiB", "TiB", "PiB"]
+    x = float(n)
+    for u in units:
+        if x < 1024 or u == units[-1]:
+            return f"{x:.2f} {u}" if u != "B" else f"{int(x)} {u}"
+        x /= 1024.0
+    return f"{n} B"
+
+
+def ensure_outside_dropbox(dest: Path, root: Path) -> None:
+    dest = dest.resolve()
+    root = root.resolve()
+    try:
+        dest.relative_to(root)
+    except ValueError:
+        return
+    raise ValueError(f"--move-to must be outside Dropbox root ({root}); got {dest}")
+
+
+def delete_match(m: Match, throttle: Optional[Throttle] = None) -> bool:
+    """Delete one match (a collapsed directory with its subtree); False if gone."""
+    if throttle is not None:
+        throttle.acquire(m.size)
+        t0 = time.monotonic()
+    try:
+        if m.is_dir:
+            shutil.rmtree(m.path)
+        else:
+            m.path.unlink()
+    except FileNotFoundError:
+        return False
+    if throttle is not None:
+        throttle.observe(time.monotonic() - t0)
+    return True
+
+
+class _TopEntry:
+    """Heap entry ordered so the root is the match that leaves the top N first."""
+
+    __slots__ = ("m",)
+
+    def __init__(self, m: Match) -> None:
+        self.m = m
+
+    def __lt__(self, other: _TopEntry) -> bool:
+        a, b = self.m, other.m
+        return a.size < b.size or (a.size == b.size and a.rel > b.rel)
+
+
+LIST_FORMATS = ("lines", "nul", "jsonl")
+
+
+class ListWriter:
+    """
+    Writes matches to the list file, or to stdout for '-', as they come.
+
+    lines: one relative path per line ('dir/' for a collapsed directory); names
+    containing a newline cannot be represented: callers leave such matches out
+    altogether (see representable), else they are skipped here (counted).
+    nul: NUL-terminated relative paths, for `xargs -0` and the like.
+    jsonl: one {"path", "size", "dir", "rule", "line"} object per match, where
+    rule/line is the rules-file line that decided it.
+    """
+
+    def __init__(
+        self, list_out: Path, fmt: str, cr: CompiledRules, append: bool = False
+    ) -> None:
+        self.fmt = fmt
+        self.cr = cr
+        self.skipped = 0
+        self.to_stdout = str(list_out) == "-"
+        if self.to_stdout:
+            self._f = sys.stdout.buffer
+        else:
+            list_out.parent.mkdir(parents=True, exist_ok=True)
+            self._f = open(list_out, "ab" if append else "wb")
+
+    def representable(self, rel: str) -> bool:
+        return self.fmt != "lines" or "\n" not in rel
+
+    def write(self, rel: str, size: int, is_dir: bool) -> None:
+        if self.fmt == "jsonl":
+            w = matching_rule(rel, self.cr)
+            line, rule = self.cr.rule_lines[w] if w >= 0 else (0, "")
+            rec = {"path": rel, "size": size, "dir": is_dir, "rule": rule, "line": line}
+            self._f.write(json.dumps(rec).encode("ascii") + b"\n")
+        elif self.fmt == "nul":
+            self._f.write(rel.encode("utf-8", "surrogateescape") + b"\0")
+        elif "\n" in rel:
+            self.skipped += 1
+        else:
+            self._f.write(rel.encode("utf-8", "surrogateescape") + b"\n")
+
+    def flush(self) -> None:
+        self._f.flush()
+
+    def close(self) -> None:
+        if self.to_stdout:
+            self._f.flush()
+        else:
+            self._f.close()
+
+
+def _iter_records(path: Path, sep: bytes) -> Iterator[bytes]:
+    """Non-empty sep-terminated records of a file, read in 1 MiB blocks."""
+    with open(path, "rb") as f:
+        tail = b""
+        while True:
+            block = f.read(1 << 20)
+            if not block:
+                break
+            records = (tail + block).split(sep)
+            tail = records.pop()
+            yield from (r for r in records if r)
+        if tail:
+            yield tail
+
+
+def iter_listed_matches(
+    root: Path, list_out: Path, fmt: str = "lines"
+) -> Iterator[Match]:
+    """
+    Matches read back from a list written by ListWriter (sizes only in jsonl),
+    with paths under the resolved root, like the matches of a scan.
+    """
+    root = root.resolve()
+    for rec in _iter_records(list_out, b"\0" if fmt == "nul" else b"\n"):
+        if fmt == "jsonl":
+            obj = json.loads(rec)
+            rel, size, is_dir = obj["path"], obj["size"], obj["dir"]
+        else:
+            rel = rec.decode("utf-8", "surrogateescape")
+            size, is_dir = 0, rel.endswith("/")
+        yield Match(path=root / rel, rel=rel, size=size, is_dir=is_dir)
+
+
+def _iter_batches(
+    root: Path,
+    cr: CompiledRules,
+    walker: str = "find",
+    jobs: int = 1,
+    procs: int = 1,
+    index: Optional[ScanIndex] = None,
+    metrics: Optional[Metrics] = None,
+) -> Iterator[Tuple[int, list[Match]]]:
+    """
+    The enumeration engine selected by the walker/jobs/procs/index options.
+    The scandir walkers list, match and stat in one pass; with metrics that pass
+    is accounted as one sampled "walk" stage.
+    """
+    if walker == "find" and index is None:
+        if procs > 1:
+            return iter_batches_procs(root, cr, procs, metrics)
+        return iter_batches_find(root, cr, metrics)
+    if index is not None:
+        batches = iter_batches_indexed(root, cr, index)
+    elif jobs > 1:
+        batches = iter_batches_parallel(root, cr, jobs)
+    else:
+        batches = iter_batches_scandir(root, cr)
+    return batches if metrics is None else _timed_batches(batches, metrics, "walk")
+
+
+def iter_ignored(
+    root: Path,
+    rules_path: Path,
+    walker: str = "find",
+    jobs: int = 1,
+    procs: int = 1,
+) -> Iterator[Match]:
+    """
+    Yield the ignored files below root as the scan finds them, in enumeration
+    order (the scandir walker yields fully ignored directories as one 'dir/'
+    Match). Options as in collect_matches.
+    """
+    root = Path(root).resolve()
+    cr = compile_rules(Path(rules_path))
+    for _, found in _iter_batches(root, cr, walker, jobs, procs):
+        yield from found
+
+
+def collect_matches(
+    root: Path,
+    rules_path: Path,
+    list_out: Path,
+    progress: bool,
+    count_first: bool,
+    progress_every: int,
+    walker: str = "find",
+    jobs: int = 1,
+    procs: int = 1,
+    index_path: Optional[Path] = None,
+    stream: bool = False,
+    top: int = 0,
+    fmt: str = "lines",
+    seen: Optional[set[str]] = None,
+    metrics: Optional[Metrics] = None,
+    rule_stats: Optional[RuleStats] = None,
+) -> Tuple[MatchStore, int, int, int]:
+    """
+    Scan root and write the matches to list_out ('-': stdout) in format fmt.
+
+    Returns (matches, total bytes, files scanned, match count). By default every
+    match is kept in a MatchStore and the list is sorted by size. With stream=True
+    (implied by list_out '-') the list is written as matches are found, in
+    enumeration order, and only the `top` largest matches are kept and returned.
+    If given, seen receives every matched relative path, metrics the time of
+    each stage, and rule_stats the hits and bytes of each rule.
+
+    Under any-match semantics, the checks are ordered by the hits of the last
+    --rule-stats run recorded next to list_out, if any.
+    """
+    cr = compile_rules(rules_path)
+    hits = load_rule_hits(list_out, cr) if cr.any_match_semantics else None
+    scan_cr = hot_ordered(cr, hits) if hits else cr
+    if hits:
+        LOG.debug("Ordering rule checks by the hits of the last --rule-stats run.")
+
+    if cr.any_match_semantics:
+        LOG.debug(
+            "Compiled rules from %s: any-match semantics enabled (no negations).",
+            rules_path,
+        )
+    else:
+        LOG.debug(
+            "Compiled rules from %s: last-match-wins semantics (negations present).",
+            rules_path,
+        )
+
+    LOG.debug(
+        "Fast buckets: basename_exact=%d, basename_prefix=%d, basename_suffix=%d, "
+        "dir_exact=%d, dir_prefix=%d, dir_suffix=%d, fallback=%d",
+        len(cr.basename_exact),
+        len(cr.basename_prefix),
+        len(cr.basename_suffix),
+        len(cr.dir_exact),
+        len(cr.dir_prefix),
+        len(cr.dir_suffix),
+        len(cr.fallback),
+    )
+
+    root = root.resolve()
+
+    # Progress total: an explicit count, else the previous run's count, else a
+    # background count feeding the bar as it goes.
+    total_files: Optional[int] = None
+    counter: Optional[FileCounter] = None
+    if progress and count_first:
+        LOG.info("Counting files for determinate progress total (extra find pass)...")
+        total_files = count_files_find(root)
+        LOG.info("Found %d files.", total_files)
+    elif progress or progress_every:
+        total_files = load_previous_count(list_out, root)
+        if total_files is not None:
+            LOG.debug("Expecting about %d files (previous run).", total_files)
+        elif progress:
+            counter = FileCounter(root)
+            counter.start()
+
+    pbar = maybe_tqdm(progress, total_files, desc="match")
+
+    matches = MatchStore(root)
+    heap: list[_TopEntry] = []
+    total_size = 0
+    scanned = 0
+    count = 0
+
+    t0 = time.time()
+    index = ScanIndex(index_path, root, cr) if index_path is not None else None
+    batches = _iter_batches(root, scan_cr, walker, jobs, procs, index, metrics)
+
+    out = ListWriter(list_out, fmt, cr)
+    stream = stream or out.to_stdout
+    # Per batch: kept in the store, or written out when streaming.
+    collect_stage = "write" if stream else "store"
+    try:
+        for n, found in batches:
+            tc = (
+                time.perf_counter()
+                if metrics is not None and metrics.sampled(collect_stage)
+                else None
+            )
+            before = scanned
+            scanned += n
+            if out.fmt == "lines":
+                # Not in the list, so not acted on either, streaming or not.
+                kept = [m for m in found if out.representable(m.rel)]
+                out.skipped += len(found) - len(kept)
+                found = kept
+            count += len(found)
+            for m in found:
+                total_size += m.size
+            if seen is not None:
+                seen.update(m.rel for m in found)
+            if rule_stats is not None:
+                rule_stats.add(found)
+            if not stream:
+                matches.extend(found)
+            else:
+                for m in found:
+                    out.write(m.rel, m.size, m.is_dir)
+                    if len(heap) < top:
+                        heapq.heappush(heap, _TopEntry(m))
+                    elif top and heap[0] < _TopEntry(m):
+                        heapq.heapreplace(heap, _TopEntry(m))
+                if out.to_stdout and found:
+                    out.flush()
+            if metrics is not None:
+                tc = None if tc is None else time.perf_counter() - tc
+                metrics.add(collect_stage, tc, len(found))
+            counting = counter is not None and counter.is_alive()
+            if counter is not None:
+                total_files = counter.count
+            if total_files is not None and scanned > total_files:
+                total_files = scanned  # the tree grew, or is still being counted
+            if progress_every and scanned // progress_every > before // progress_every:
+                if total_files and not counting:
+                    LOG.info(
+                        "Scanned %d of ~%d files (%.0f%%); matches so far: %d",
+                        scanned,
+                        total_files,
+                        100.0 * scanned / total_files,
+                        count,
+                    )
+                else:
+                    LOG.info("Scanned %d files; matches so far: %d", scanned, count)
+            if pbar is not None:
+                if total_files and pbar.total != total_files:
+                    pbar.total = total_files
+                pbar.update(n)
+    except BaseException:
+        out.close()
+        raise
+    finally:
+        if counter is not None:
+            counter.stop()
+
+    if pbar is not None:
+        pbar.total = scanned
+        pbar.close()
+    save_count(list_out, root, scanned)
+
+    if index is not None:
+        with timed(metrics, "index", index.listed + index.reused):
+            index.save()
+        LOG.info(
+            "Scan index: %d directories reused, %d listed.",
+            index.reused,
+            index.listed,
+        )
+
+    # Ties broken by path so the list is identical whatever the enumeration order.
+    if not stream:
+        with timed(metrics, "sort", len(matches)):
+            matches.sort()
+        with timed(metrics, "write", len(matches)):
+            for rel, size, is_dir in matches.entries():
+                out.write(rel, size, is_dir)
+    else:
+        matches.extend(sorted((e.m for e in heap), key=lambda m: (-m.size, m.rel)))
+    out.close()
+    if out.skipped:
+        LOG.warning(
+            "%d matched names contain a newline: left out of %s, the counts and "
+            "any --delete/--move-to (use --format nul or jsonl).",
+            out.skipped,
+            list_out,
+        )
+
+    elapsed = max(1e-9, time.time() - t0)
+    LOG.info(
+        "Scanned %d files in %.1fs (%.0f files/s).",
+        scanned,
+        elapsed,
+        scanned / elapsed,
+    )
+
+    return matches, total_size, scanned, count
+
+
+# -----------------------------
+# Rule statistics
+# -----------------------------
+
+
+class RuleStats:
+    """
+    Per-rule counters for --rule-stats: matches and bytes, each match credited to
+    the rule deciding it (see matching_rule; a collapsed directory is one match
+    holding the bytes below it), plus the cost of each fallback rule's regex.
+
+    The hit counts are kept next to the list file; under any-match semantics the
+    next scans order their checks by them (see hot_ordered).
+    """
+
+    def __init__(self, cr: CompiledRules) -> None:
+        self.cr = cr
+        self.hits = [0] * len(cr.ordered_raw)
+        self.bytes = [0] * len(cr.ordered_raw)
+
+    def add(self, found: Iterable[Match]) -> None:
+        for m in found:
+            i = matching_rule(m.rel, self.cr)
+            if i >= 0:
+                self.hits[i] += 1
+                self.bytes[i] += m.size
+
+    def regex_costs(self, root: Path, rounds: int = 3) -> dict[int, float]:
+        """
+        Nanoseconds per path of each fallback rule's regex alone, best of `rounds`
+        over a sample of root. Bucket rules cost one hash probe each and are not
+        timed.
+        """
+        dirs, files = _sample_paths(root)
+        costs: dict[int, float] = {}
+        for r in self.cr.fallback:
+            cost = _regex_cost_ns(r, dirs, files, rounds)
+            if cost is not None:
+                costs[r.index] = cost
+        return costs
+
+    def report(self, root: Path) -> list[dict[str, Any]]:
+        """One record per rule, in file order."""
+        costs = self.regex_costs(root)
+        rows = []
+        for i, (lineno, text) in enumerate(self.cr.rule_lines):
+            cost = costs.get(i)
+            rows.append(
+                {
+                    "line": lineno,
+                    "rule": text,
+                    "engine": _classify_rule(self.cr.ordered_raw[i][2])[0],
+                    "hits": self.hits[i],
+                    "bytes": self.bytes[i],
+                    "ns_per_path": None if cost is None else round(cost, 1),
+                }
+            )
+        return rows
+
+
+def _sample_paths(root: Path, limit: int = 1000) -> Tuple[list[str], list[str]]:
+    """
+    Lowercase relative (directory, file) paths, up to `limit` of each, from a
+    breadth-first listing of root: a cheap sample of the tree for timing rules.
+    """
+    dirs: list[str] = []
+    files: list[str] = []
+    todo = deque([(str(root), "")])
+    while todo and (len(dirs) < limit or len(files) < limit):
+        path, rel = todo.popleft()
+        try:
+            with os.scandir(path) as it:
+                entries = list(it)
+        except OSError:
+            continue
+        for e in entries:
+            if not rel and e.name in DROPBOX_INTERNAL_DIRS:
+                continue
+            r = rel + "/" + e.name.lower() if rel else e.name.lower()
+            try:
+                is_dir = e.is_dir(follow_symlinks=False)
+            except OSError:
+                continue
+            if is_dir:
+                if len(dirs) < limit:
+                    dirs.append(r)
+                todo.append((e.path, r))
+            elif len(files) < limit:
+                files.append(r)
+    return dirs, files
+
+
+def _best_ns_per_item(
+    fn: Callable[[str], object], sample: list[str], rounds: int
+) -> float:
+    best = None
+    for _ in range(rounds):
+        t0 = time.perf_counter_ns()
+        for rel in sample:
+            fn(rel)
+        dt = time.perf_counter_ns() - t0
+        best = dt if best is None else min(best, dt)
+    assert best is not None
+    return best / len(sample)
+
+
+def _regex_cost_ns(
+    r: FallbackRule, dirs: list[str], files: list[str], rounds: int = 3
+) -> Optional[float]:
+    """ns per path of r's regex alone: directory rules on dirs, others on files."""
+    as_dir = _dir_rule_name(r.pat2) is not None
+    sample = dirs if as_dir else files
+    if not sample:
+        return None
+    rx = re.compile(_glob_regex(r.anchored, r.pat2, as_dir), re.DOTALL)
+    return _best_ns_per_item(rx.match, sample, rounds)
+
+
+def _rules_digest(cr: CompiledRules) -> str:
+    return hashlib.sha256(json.dumps(cr.ordered_raw).encode()).hexdigest()
+
+
+def load_rule_hits(list_out: Path, cr: CompiledRules) -> Optional[list[int]]:
+    """Per-rule hits recorded by the last --rule-stats run, if the rules match."""
+    try:
+        data = json.loads(_cache_path(list_out, "rules").read_text(encoding="utf-8"))
+        if data["digest"] != _rules_digest(cr):
+            return None
+        hits = [int(row["hits"]) for row in data["rules"]]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+    return hits if len(hits) == len(cr.ordered_raw) and any(hits) else None
+
+
+def save_rule_stats(
+    list_out: Path, root: Path, cr: CompiledRules, rows: list[dict[str, Any]]
+) -> Path:
+    path = _cache_path(list_out, "rules")
+    data = {"root": str(root), "digest": _rules_digest(cr), "rules": rows}
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(data, indent=2) + "\n", "utf-8")
+    return path
+
+
+def log_rule_stats(rows: list[dict[str, Any]], top: int = 25) -> None:
+    hit = sorted((r for r in rows if r["hits"]), key=lambda r: -r["bytes"])
+    LOG.info("Rules by matched bytes (%d of %d rules matched):", len(hit), len(rows))
+    for r in hit[:top]:
+        LOG.info(
+            "  %10s  %8d matches  line %4d  %s",
+            human_bytes(r["bytes"]),
+            r["hits"],
+            r["line"],
+            r["rule"],
+        )
+    idle = [r for r in rows if not r["hits"]]
+    if idle:
+        LOG.info(
+            "Rules that matched nothing (lines): %s",
+            ", ".join(str(r["line"]) for r in idle),
+        )
+    costly = sorted(
+        (r for r in rows if r["ns_per_path"] is not None),
+        key=lambda r: -r["ns_per_path"],
+    )
+    if costly:
+        LOG.info("Costliest regex rules (ns per path, sampled):")
+        for r in costly[:5]:
+            LOG.info("  %8.0f  line %4d  %s", r["ns_per_path"], r["line"], r["rule"])
+
+
+def _glob_witness(part: str, fill: str) -> str:
+    """A name matching one glob component: '*' becomes fill, '?' and '[seq]' a char."""
+    out: list[str] = []
+    i, n = 0, len(part)
+    while i < n:
+        c = part[i]
+        i += 1
+        if c == "*":
+            out.append(fill)
+        elif c == "?":
+            out.append(fill[0])
+        elif c == "[" and "]" in part[i + 1 :]:
+            j = part.index("]", i + 1)
+            seq = part[i - 1 : j + 1]
+            out.append(
+                next((x for x in _WITNESS_CHARS if fnmatchcase(x, seq)), fill[0])
+            )
+            i = j + 1
+        else:
+            out.append(c)
+    return "".join(out)
+
+
+_WITNESS_CHARS = "xq7_.-abcdefghijklmnoprstuvwyz0123456789"
+
+
+def _rule_witnesses(raw: Tuple[bool, bool, str]) -> list[str]:
+    """
+    Relative paths that the rule matches, built from its pattern with two different
+    fillers for wildcards; empty if they do not (e.g. a pattern nothing can match).
+    """
+    neg, anchored, pat2 = raw
+    dir_name = _dir_rule_name(pat2)
+    body = pat2 if dir_name is None else dir_name
+    paths = []
+    for fill in ("x", "q7"):
+        parts = [_glob_witness(p, fill) for p in body.split("/") if p != "**"]
+        if dir_name is not None:
+            parts.append(fill + ".bin")  # a file below the directory
+        path = "/".join(p for p in parts if p)
+        if not path or not _trusted_match(path, neg, anchored, pat2):
+            return []
+        paths.append(path)
+    return paths
+
+
+def explain_rules(cr: CompiledRules, root: Path) -> list[dict[str, Any]]:
+    """
+    Static report of a compiled rule set, one record per rule in file order:
+    - engine: the bucket the rule compiled to, "regex" (fallback) or "ignored";
+    - cost: estimated per-path cost relative to one hash probe. Regex rules are
+      timed alone on a small sample of root; bucket rules cost one probe;
+    - notes: negations (they force last-match-wins evaluation), rules covered by
+      another one, negations with nothing to re-include, and regex rules that a
+      '**/' prefix would move to a bucket.
+    Coverage is checked on example paths built from each rule (_rule_witnesses)
+    with the reference matcher, so it is a strong hint rather than a proof.
+    """
+    dirs, files = _sample_paths(root)
+    if not files:
+        files = [w for raw in cr.ordered_raw for w in _rule_witnesses(raw)]
+        dirs = sorted({f.rsplit("/", 1)[0] for f in files if "/" in f})
+    names = [f.rsplit("/", 1)[-1] for f in files]
+    probe = _best_ns_per_item(cr.basename_exact.get, names, 3) if names else 0.0
+    costs = {r.index: _regex_cost_ns(r, dirs, files) for r in cr.fallback}
+    witnesses = [_rule_witnesses(raw) for raw in cr.ordered_raw]
+
+    negs = list(itertools.accumulate((raw[0] for raw in cr.ordered_raw), initial=0))
+
+    def covers(j: int, paths: list[str]) -> bool:
+        neg, anchored, pat2 = cr.ordered_raw[j]
+        return all(_trusted_match(w, neg, anchored, pat2) for w in paths)
+
+    def negation_between(a: int, b: int) -> bool:
+        lo, hi = min(a, b), max(a, b)
+        return negs[hi] > negs[lo + 1]
+
+    rows = []
+    for i, (lineno, text) in enumerate(cr.rule_lines):
+        neg, anchored, pat2 = cr.ordered_raw[i]
+        bucket = _classify_rule(pat2)[0]
+        notes: list[str] = []
+        engine = {"fallback": "regex", "skip": "ignored"}.get(bucket, bucket)
+        cost: Optional[float] = 1.0
+        if bucket == "skip":
+            cost = None
+            notes.append("matches nothing; ignored")
+        elif bucket == "fallback":
+            ns = costs.get(i)
+            cost = ns / probe if ns is not None and probe > 0 else None
+            hint = _classify_rule("**/" + pat2)[0] if not anchored else "fallback"
+            if hint not in ("fallback", "skip"):
+                notes.append(f"written as '**/{pat2}' it would use {hint}")
+        paths = witnesses[i]
+        if neg:
+            notes.append("negation: forces last-match-wins for the whole rule set")
+            if paths and not any(
+                covers(j, paths) for j in range(i) if not cr.ordered_raw[j][0]
+            ):
+                notes.append("nothing matched by an earlier rule to re-include")
+        elif paths:
+            # Covered by j: every example path of i is matched by j. A later j
+            # always decides those paths instead of i; an earlier j only does if
+            # no negation in between re-includes some of them. Two rules covering
+            # each other are duplicates: the later one is flagged, or the earlier
+            # one when a negation sits between them.
+            for j in range(len(cr.ordered_raw)):
+                if j == i or cr.ordered_raw[j][0] or not covers(j, paths):
+                    continue
+                if j < i and negation_between(i, j):
+                    continue
+                if (
+                    j > i
+                    and not negation_between(i, j)
+                    and witnesses[j]
+                    and covers(i, witnesses[j])
+                ):
+                    continue
+                line, rule = cr.rule_lines[j]
+                notes.append(f"covered by line {line} ({rule}): redundant")
+                break
+        rows.append(
+            {
+                "line": lineno,
+                "rule": text,
+                "engine": engine,
+                "cost": None if cost is None else round(cost, 1),
+                "notes": notes,
+            }
+        )
+    return rows
+
+
+def print_rule_explanation(
+    rows: list[dict[str, Any]], cr: CompiledRules, rules_path: Path
+) -> None:
+    out = sys.stdout
+    negations = [r["line"] for r, raw in zip(rows, cr.ordered_raw) if raw[0]]
+    out.write(f"Rules file : {rules_path}\n")
+    if cr.any_match_semantics:
+        out.write("Semantics  : any-match (no negations): first hit decides\n")
+    else:
+        lines = ", ".join(map(str, negations))
+        out.write(
+            f"Semantics  : last-match-wins, forced by the negations on lines {lines}: "
+            "every check runs on every path\n"
+        )
+    engines: dict[str, int] = {}
+    for r in rows:
+        engines[r["engine"]] = engines.get(r["engine"], 0) + 1
+    out.write(
+        "Engines    : "
+        + ", ".join(f"{name} {n}" for name, n in sorted(engines.items()))
+        + "\n\n"
+    )
+    out.write(f"{'line':>5}  {'engine':<16} {'cost':>6}  rule\n")
+    for r in rows:
+        cost = "-" if r["cost"] is None else f"{r['cost']:.1f}"
+        out.write(f"{r['line']:>5}  {r['engine']:<16} {cost:>6}  {r['rule']}\n")
+        for note in r["notes"]:
+            out.write(f"{'':>31}^ {note}\n")
+    out.write(
+        "\ncost: estimated time per path relative to one hash probe (regex rules "
+        "timed on a sample of the tree).\n"
+    )
+
+
+# -----------------------------
+# Throttling
+# -----------------------------
+
+
+class Throttle:
+    """
+    Token buckets shared by the delete/move threads, one for operations and one
+    for bytes (a rate of 0 means unlimited). Callers take tokens before each
+    operation and sleep off any debt, so a burst is spread at the given rates.
+
+    With adaptive=True, operation latencies are also tracked. When their moving
+    average exceeds `backoff` times the running baseline, a per-operation pause
+    doubles (up to one second). It decays again once latency recovers.
+    """
+
+    def __init__(
+        self,
+        ops_per_sec: float = 0.0,
+        bytes_per_sec: float = 0.0,
+        adaptive: bool = False,
+        backoff: float = 3.0,
+    ) -> None:
+        self.ops_rate = ops_per_sec
+        self.bytes_rate = bytes_per_sec
+        self.adaptive = adaptive
+        self.backoff = backoff
+        self._ops = ops_per_sec  # one second of burst to start with
+        self._bytes = bytes_per_sec
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+        self._latency: Optional[float] = None  # moving average, seconds
+        self._baseline: Optional[float] = None
+        self._pause = 0.0
+        self._adjusted = 0.0
+
+    @property
+    def limits_bytes(self) -> bool:
+        return self.bytes_rate > 0
+
+    def acquire(self, nbytes: int = 0, ops: int = 1) -> None:
+        with self._lock:
+            now = time.monotonic()
+            elapsed, self._last = now - self._last, now
+            wait = self._pause
+            if self.ops_rate > 0 and ops:
+                self._ops = min(self.ops_rate, self._ops + elapsed * self.ops_rate)
+                self._ops -= ops
+                wait = max(wait, -self._ops / self.ops_rate)
+            if self.bytes_rate > 0 and nbytes:
+                self._bytes = min(
+                    self.bytes_rate, self._bytes + elapsed * self.bytes_rate
+                )
+                self._bytes -= nbytes
+                wait = max(wait, -self._bytes / self.bytes_rate)
+        if wait > 0:
+            time.sleep(wait)
+
+    def observe(self, latency: float) -> None:
+        """Record how long an operation took (adaptive mode only)."""
+        if not self.adaptive:
+            return
+        with self._lock:
+            avg = self._latency
+            avg = latency if avg is None else 0.9 * avg + 0.1 * latency
+            self._latency = avg
+            # The baseline follows the fastest recent average and creeps up slowly,
+            # so a lasting change of medium becomes the new normal.
+            base = self._baseline
+            self._baseline = avg if base is None else min(avg, base * 1.001)
+            now = time.monotonic()
+            if now - self._adjusted < 0.25:
+                return
+            self._adjusted = now
+            if avg > self.backoff * self._baseline:
+                self._pause = min(1.0, max(1e-3, 2 * self._pause))
+            else:
+                self._pause = 0.0 if self._pause < 1e-4 else self._pause / 2
+
+
+def parse_bytes(s: str) -> int:
+    """'512', '64K', '1.5M', '2GiB' -> bytes (binary units, as human_bytes)."""
+    m = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([kmgtp]?)(?:i?b)?\s*", s, re.I)
+    if m is None:
+        raise argparse.ArgumentTypeError(f"invalid byte count: {s!r}")
+    unit = m.group(2).lower()
+    return int(float(m.group(1)) * 1024 ** ("kmgtp".index(unit) + 1 if unit else 0))
+
+
+# -----------------------------
+# Delete engine
+# -----------------------------
+
+# Matches handed to the delete/move pools per round; bounds their memory.
+_IO_WINDOW = 1 << 16
+
+
+def _delete_in_dir(
+    dir_abs: str,
+    entries: list[Tuple[str, bool, int]],
+    throttle: Optional[Throttle] = None,
+) -> int:
+    """Remove entries (name, is_dir, size) of one directory through one dir fd."""
+    try:
+        fd = os.open(dir_abs, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW)
+    except FileNotFoundError:
+        return 0
+    except OSError as e:
+        LOG.warning("Cannot open %s: %s", dir_abs, e)
+        return 0
+    removed = 0
+    try:
+        for name, is_dir, size in entries:
+            try:
+                if throttle is not None:
+                    if not size and not is_dir and throttle.limits_bytes:
+                        size = os.stat(name, dir_fd=fd, follow_symlinks=False).st_size
+                    throttle.acquire(size)
+                    t0 = time.monotonic()
+                if is_dir:
+                    shutil.rmtree(name, dir_fd=fd)
+                else:
+                    os.unlink(name, dir_fd=fd)
+                if throttle is not None:
+                    throttle.observe(time.monotonic() - t0)
+                removed += 1
+            except FileNotFoundError:
+                continue
+            except OSError as e:
+                LOG.warning("Cannot delete %s/%s: %s", dir_abs, name, e)
+    finally:
+        os.close(fd)
+    return removed
+
+
+def _prune_empty_dirs(root_abs: str, dirs: set[str]) -> int:
+    """rmdir dirs, then their ancestors below root_abs, deepest first, while empty."""
+    below = root_abs.rstrip("/") + "/"
+    levels: dict[int, set[str]] = {}
+    for d in dirs:
+        if d.startswith(below):
+            levels.setdefault(d.count("/"), set()).add(d)
+    removed = 0
+    while levels:
+        depth = max(levels)
+        for d in levels.pop(depth):
+            try:
+                os.rmdir(d)
+            except OSError:
+                continue  # not empty, or already gone
+            removed += 1
+            parent = d.rpartition("/")[0]
+            if parent.startswith(below):
+                levels.setdefault(depth - 1, set()).add(parent)
+    return removed
+
+
+def delete_matches(
+    matches: Iterable[Match],
+    threads: int = 8,
+    prune_root: Optional[Path] = None,
+    throttle: Optional[Throttle] = None,
+) -> Tuple[int, int]:
+    """
+    Delete matches on a thread pool, grouped by parent directory: one dir fd per
+    group, unlinkat per file and rmtree(dir_fd=...) for a collapsed directory.
+    With prune_root, directories this leaves empty are then removed bottom-up,
+    stopping below prune_root. Returns (entries deleted, directories pruned).
+    Bytes counted by a throttle are the matches' sizes.
+    """
+    deleted = 0
+    parents: set[str] = set()
+    it = iter(matches)
+    ex = ThreadPoolExecutor(max_workers=threads) if threads > 1 else None
+    try:
+        while True:
+            window = list(itertools.islice(it, _IO_WINDOW))
+            if not window:
+                break
+            groups: dict[str, list[Tuple[str, bool, int]]] = {}
+            for m in window:
+                parent, _, name = str(m.path).rpartition("/")
+                groups.setdefault(parent, []).append((name, m.is_dir, m.size))
+            parents.update(groups)
+            done = (ex.map if ex is not None else map)(
+                partial(_delete_in_dir, throttle=throttle),
+                groups.keys(),
+                groups.values(),
+            )
+            deleted += sum(done)
+    finally:
+        if ex is not None:
+            ex.shutdown()
+    pruned = 0
+    if prune_root:
+        # Match paths are resolved: a relative or symlinked root must be too.
+        pruned = _prune_empty_dirs(str(Path(prune_root).resolve()), parents)
+    return deleted, pruned
+
+
+# -----------------------------
+# Move engine
+# -----------------------------
+
+# A resumed partial copy restarts this far back, in case its tail was not written.
+_RESUME_SLACK = 1 << 20
+
+
+def _copy_range(src_fd: int, dst_fd: int, offset: int, size: int) -> None:
+    """Copy bytes [offset, size) of src to the same offsets of dst, in the kernel."""
+    use_cfr = hasattr(os, "copy_file_range")
+    while offset < size:
+        n = min(size - offset, 1 << 30)
+        if use_cfr:
+            try:
+                done = os.copy_file_range(src_fd, dst_fd, n, offset, offset)
+            except OSError as e:
+                if e.errno not in (
+                    errno.EXDEV,
+                    errno.ENOSYS,
+                    errno.EINVAL,
+                    errno.EOPNOTSUPP,
+                ):
+                    raise
+                use_cfr = False
+                continue
+        else:
+            os.lseek(dst_fd, offset, os.SEEK_SET)
+            done = os.sendfile(dst_fd, src_fd, offset, n)
+        if not done:
+            break  # the source shrank meanwhile
+        offset += done
+
+
+def _source_id(st: os.stat_result) -> str:
+    """Identity of a copy's source, recorded next to its .partial file."""
+    return f"{st.st_size} {st.st_mtime_ns} {st.st_ino}"
+
+
+def _fsync_dir(path: str) -> None:
+    """Make the entries of directory path durable."""
+    fd = os.open(path, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _copy_file(src: str, dst: str) -> int:
+    """
+    Copy src to dst through dst + '.partial', continuing a partial copy left by an
+    interrupted run of the same source version (size, mtime, inode, as recorded in
+    dst + '.partial.src'); any other partial copy starts over. The data is fsync'd
+    before the rename, not the directory entry. Returns the number of bytes copied.
+    """
+    part = dst + ".partial"
+    sidecar = part + ".src"
+    sfd = os.open(src, os.O_RDONLY | os.O_NOFOLLOW)
+    try:
+        sst = os.fstat(sfd)
+        size = sst.st_size
+        try:
+            with open(sidecar, encoding="ascii") as f:
+                same = f.read() == _source_id(sst)
+        except (FileNotFoundError, UnicodeDecodeError):
+            same = False
+        dfd = os.open(part, os.O_WRONLY | os.O_CREAT, 0o600)
+        try:
+            start = 0
+            if same:
+                start = min(os.fstat(dfd).st_size, size)
+                start = max(0, start - _RESUME_SLACK)
+            os.ftruncate(dfd, start)
+            if not same:
+                with open(sidecar, "w", encoding="ascii") as f:
+                    f.write(_source_id(sst))
+            _copy_range(sfd, dfd, start, size)
+            os.fsync(dfd)
+        finally:
+            os.close(dfd)
+    finally:
+        os.close(sfd)
+    shutil.copystat(src, part, follow_symlinks=False)
+    os.replace(part, dst)
+    os.unlink(sidecar)
+    return size - start
+
+
+def _copy_tree(src: str, dst: str) -> int:
+    """
+    Copy a directory through dst + '.partial', skipping files already copied;
+    every directory of the copy, and its parent, is fsync'd once complete.
+    """
+    copied = 0
+
+    def copy(s: str, d: str) -> str:
+        nonlocal copied
+        try:
+            ss, ds = os.lstat(s), os.lstat(d)
+            if ss.st_size == ds.st_size and ss.st_mtime_ns == ds.st_mtime_ns:
+                return d
+        except FileNotFoundError:
+            pass
+        copied += _copy_file(s, d)
+        return d
+
+    part = dst + ".partial"
+    shutil.copytree(src, part, symlinks=True, copy_function=copy, dirs_exist_ok=True)
+    for d, _, _ in os.walk(part):
+        _fsync_dir(d)
+    os.replace(part, dst)
+    _fsync_dir(os.path.dirname(dst))
+    return copied
+
+
+MOVE_JOURNAL = ".cleanup_dropbox_ignored.journal"  # default, in the destination
+
+
+class MoveJournal:
+    """
+    Append-only JSON-lines journal of cross-device moves: a record is written once
+    a match's copy is complete at its destination, before the source is removed.
+    A resumed run removes such sources without copying them again, if their
+    target is still in place with the recorded size.
+    """
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        self.copied: dict[str, Tuple[int, int]] = {}  # rel -> (size, mtime_ns)
+        try:
+            with open(path, encoding="ascii") as f:
+                for line in f:
+                    try:
+                        rec = json.loads(line)
+                    except ValueError:
+                        continue  # torn last line of an interrupted run
+                    self.copied[rec["rel"]] = (rec["size"], rec["mtime_ns"])
+        except FileNotFoundError:
+            pass
+        if self.copied:
+            LOG.info(
+                "Resuming: %d entries already copied per %s", len(self.copied), path
+            )
+        self._f = open(path, "a", encoding="ascii")
+        self._lock = threading.Lock()
+
+    def record(self, rel: str, st: os.stat_result) -> None:
+        line = json.dumps({"rel": rel, "size": st.st_size, "mtime_ns": st.st_mtime_ns})
+        with self._lock:
+            self._f.write(line + "\n")
+            self._f.flush()
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class _Mover:
+    """Moves one match at a time; shared by the pool threads."""
+
+    def __init__(
+        self, dest: Path, journal: MoveJournal, throttle: Optional[Throttle] = None
+    ) -> None:
+        self.dest = str(dest)
+        self.journal = journal
+        self.throttle = throttle
+        self._dirs: set[str] = set()
+        self._lock = threading.Lock()
+
+    def _ensure_dir(self, d: str) -> None:
+        with self._lock:
+            if d in self._dirs:
+                return
+        os.makedirs(d, exist_ok=True)
+        with self._lock:
+            self._dirs.add(d)
+
+    def _journaled(self, m: Match, st: os.stat_result, target: str) -> bool:
+        """Whether a previous run completed this copy, and its target is still there."""
+        if self.journal.copied.get(m.rel) != (st.st_size, st.st_mtime_ns):
+            return False
+        try:
+            tst = os.lstat(target)
+        except FileNotFoundError:
+            return False
+        if m.is_dir:
+            return stat.S_ISDIR(tst.st_mode)
+        return stat.S_ISREG(tst.st_mode) and tst.st_size == st.st_size
+
+    def move(self, m: Match) -> Tuple[bool, int]:
+        """(moved, bytes copied); a rename within one filesystem copies nothing."""
+        src = str(m.path)
+        target = os.path.join(self.dest, m.rel.rstrip("/"))
+        try:
+            st = os.lstat(src)
+        except FileNotFoundError:
+            return False, 0
+        self._ensure_dir(os.path.dirname(target))
+        throttle = self.throttle
+        if throttle is not None:
+            throttle.acquire()
+            t0 = time.monotonic()
+        try:
+            os.rename(src, target)
+            if throttle is not None:
+                throttle.observe(time.monotonic() - t0)
+            return True, 0
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+        if self._journaled(m, st, target):
+            copied = 0
+        else:
+            if throttle is not None:
+                # Only bytes: the operation was counted for the rename attempt.
+                throttle.acquire(m.size if m.is_dir else st.st_size, ops=0)
+            if m.is_dir:
+                copied = _copy_tree(src, target)
+            else:
+                copied = _copy_file(src, target)
+                _fsync_dir(os.path.dirname(target))
+            self.journal.record(m.rel, st)
+        if m.is_dir:
+            shutil.rmtree(src)
+        else:
+            os.unlink(src)
+        return True, copied
+
+
+def move_matches(
+    matches: Iterable[Match],
+    dest: Path,
+    threads: int = 8,
+    journal_path: Optional[Path] = None,
+    throttle: Optional[Throttle] = None,
+) -> Tuple[int, int, int]:
+    """
+    Move matches to dest/<rel> on a thread pool: os.rename when source and target
+    share a filesystem, otherwise an in-kernel copy (copy_file_range, sendfile)
+    then removal of the source, journaled so an interrupted run can resume.
+    Target directories are created once each. Returns (moved, bytes copied,
+    failures); the journal is removed after a run without failures.
+    """
+    dest.mkdir(parents=True, exist_ok=True)
+    journal_path = journal_path or dest / MOVE_JOURNAL
+    journal = MoveJournal(journal_path)
+    mover = _Mover(dest, journal, throttle)
+    moved = copied = failed = 0
+
+    def run(m: Match) -> Tuple[bool, int]:
+        try:
+            return mover.move(m)
+        except OSError as e:
+            LOG.warning("Cannot move %s: %s", m.rel, e)
+            return False, -1
+
+    it = iter(matches)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, threads)) as ex:
+            while True:
+                window = list(itertools.islice(it, _IO_WINDOW))
+                if not window:
+                    break
+                for ok, n in ex.map(run, window):
+                    moved += ok
+                    if n < 0:
+                        failed += 1
+                    else:
+                        copied += n
+    finally:
+        journal.close()
+    if not failed:
+        journal_path.unlink(missing_ok=True)
+    return moved, copied, failed
+
+
+# -----------------------------
+# Watch mode (inotify)
+# -----------------------------
+
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_DONT_FOLLOW = 0x02000000
+IN_EXCL_UNLINK = 0x04000000
+IN_ISDIR = 0x40000000
+
+_WATCH_MASK = (
+    IN_CREATE
+    | IN_MOVED_TO
+    | IN_MOVED_FROM
+    | IN_DELETE
+    | IN_ONLYDIR
+    | IN_DONT_FOLLOW
+    | IN_EXCL_UNLINK
+)
+# struct inotify_event header: wd, mask, cookie, len (name follows, NUL-padded)
+_INOTIFY_EVENT = struct.Struct("iIII")
+
+
+class Inotify:
+    """Minimal ctypes binding of the Linux inotify API."""
+
+    def __init__(self) -> None:
+        libc = ctypes.CDLL(None, use_errno=True)
+        try:
+            init = libc.inotify_init1
+            self._add = libc.inotify_add_watch
+            self._rm = libc.inotify_rm_watch
+        except AttributeError:
+            raise OSError(errno.ENOSYS, "inotify is not available") from None
+        self._add.argtypes = (ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32)
+        self._rm.argtypes = (ctypes.c_int, ctypes.c_int)
+        self.fd = init(os.O_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+
+    def add_watch(self, path: str, mask: int) -> int:
+        wd = self._add(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        self._rm(self.fd, wd)  # EINVAL if the kernel already dropped it: fine
+
+    def read(self, timeout: Optional[float]) -> list[Tuple[int, int, str]]:
+        """Pending events as (wd, mask, name); empty if none within timeout."""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        if not ready:
+            return []
+        buf = os.read(self.fd, 1 << 16)
+        events = []
+        pos = 0
+        while pos < len(buf):
+            wd, mask, _cookie, n = _INOTIFY_EVENT.unpack_from(buf, pos)
+            pos += _INOTIFY_EVENT.size
+            events.append((wd, mask, os.fsdecode(buf[pos : pos + n].rstrip(b"\0"))))
+            pos += n
+        return events
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+class Watcher:
+    """
+    Keeps the ignored set of a tree current from inotify events.
+
+    Every directory the walker descends into is watched; fully ignored subtrees
+    are not, they are one collapsed entry already. Created and moved-in entries
+    are matched as they appear, new directories are walked and watched. Once the
+    kernel refuses more watches (fs.inotify.max_user_watches), the remaining
+    directories are polled by mtime instead. A queue overflow triggers a rescan.
+    """
+
+    def __init__(
+        self,
+        root: Path,
+        cr: CompiledRules,
+        live: set[str],
+        list_out: Path,
+        fmt: str,
+        action: Optional[Callable[[Match], bool]],
+        delay: float,
+        poll_every: float,
+    ) -> None:
+        self.root_item: _DirItem = (str(root.resolve()), "", "", -1)
+        self.cr = cr
+        self.live = live
+        self.action = action
+        self.delay = delay
+        self.poll_every = poll_every
+        self.inotify = Inotify()
+        self.dirs: dict[int, _DirItem] = {}
+        self.wd_of: dict[str, int] = {}
+        self.polled: dict[str, Tuple[_DirItem, int]] = {}  # rel -> (item, mtime_ns)
+        self.due: deque[Tuple[float, Match]] = deque()
+        self.found = 0
+        self.applied = 0
+        self._warned_limit = False
+        # During the first walk: directories the scan listed file by file.
+        self._listed_dirs: set[str] = set()
+        self._out = ListWriter(list_out, fmt, cr, append=True)
+
+    def close(self) -> None:
+        self._out.close()
+        self.inotify.close()
+
+    def _watch(self, item: _DirItem) -> None:
+        dir_abs, dir_rel = item[0], item[1]
+        try:
+            wd = self.inotify.add_watch(dir_abs, _WATCH_MASK)
+        except OSError as e:
+            if e.errno != errno.ENOSPC:
+                return  # gone, or not a directory any more
+            if not self._warned_limit:
+                LOG.warning(
+                    "inotify watch limit reached; polling remaining directories "
+                    "every %.0fs (raise fs.inotify.max_user_watches to avoid).",
+                    self.poll_every,
+                )
+                self._warned_limit = True
+            try:
+                self.polled[dir_rel] = (item, os.lstat(dir_abs).st_mtime_ns)
+            except OSError:
+                pass
+            return
+        self.dirs[wd] = item
+        self.wd_of[dir_rel] = wd
+
+    def _walk(self, item: _DirItem, fresh: bool) -> None:
+        """Watch item and every directory below it, reporting unseen matches."""
+        stack = [item]
+        while stack:
+            it = stack.pop()
+            self._watch(it)
+            _, found, subdirs = _scan_dir(it, self.cr, size_collapsed=False)
+            for m in found:
+                self._report(m, fresh)
+            stack.extend(subdirs)
+
+    def _report(self, m: Match, keep_empty: bool = True) -> None:
+        if m.rel in self.live:
+            return
+        if not self._out.representable(m.rel):
+            LOG.warning("Left out %r: a newline needs --format nul or jsonl.", m.rel)
+            return
+        if m.is_dir and m.rel in self._listed_dirs:
+            self.live.add(m.rel)  # already listed, as its files (find walker)
+            return
+        if m.is_dir:
+            n, m.size = _tree_size(str(m.path))
+            if not n and not keep_empty:
+                return
+        self.live.add(m.rel)
+        self._out.write(m.rel, m.size, m.is_dir)
+        self._out.flush()
+        self.found += 1
+        LOG.info("New match: %s (%s)", m.rel, human_bytes(m.size))
+        if self.action is not None:
+            self.due.append((time.monotonic() + self.delay, m))
+
+    def _drop_tree(self, rel: str) -> None:
+        """Forget watches, polled dirs and live entries at or below rel."""
+        prefix = rel + "/"
+        for r in [r for r in self.wd_of if r == rel or r.startswith(prefix)]:
+            wd = self.wd_of.pop(r)
+            self.dirs.pop(wd, None)
+            self.inotify.rm_watch(wd)
+        for r in [r for r in self.polled if r == rel or r.startswith(prefix)]:
+            del self.polled[r]
+        self.live.difference_update([r for r in self.live if r.startswith(prefix)])
+
+    def _entry(self, item: _DirItem, name: str, is_dir: bool) -> None:
+        """Match one created or moved-in entry of a watched directory."""
+        dir_abs, dir_rel, dir_rel_l, inherited = item
+        cr = self.cr
+        name_l = name.lower()
+        path = dir_abs + "/" + name
+        rel = dir_rel + "/" + name if dir_rel else name
+        rel_l = dir_rel_l + "/" + name_l if dir_rel else name_l
+        if is_dir:
+            if not dir_rel and name_l in DROPBOX_INTERNAL_DIRS:
+                return
+            w = max(_dir_last_match(name_l, rel_l, cr), inherited)
+            if w >= 0 and _subtree_ignored(w, cr):
+                self._report(Match(path=Path(path), rel=rel + "/", size=0, is_dir=True))
+            else:
+                self._walk((path, rel, rel_l, w), fresh=True)
+            return
+        if rel_l == "rules.dropboxignore":
+            return
+        w = max(_file_last_match(name_l, rel_l, cr), inherited)
+        if w < 0 or cr.negated[w]:
+            return
+        try:
+            st = os.lstat(path)
+        except OSError:
+            return
+        if stat.S_ISREG(st.st_mode):
+            self._report(Match(path=Path(path), rel=rel, size=int(st.st_size)))
+
+    def _handle(self, events: list[Tuple[int, int, str]]) -> None:
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                LOG.warning("inotify queue overflowed; rescanning the tree.")
+                self._walk(self.root_item, fresh=False)
+                continue
+            if mask & IN_IGNORED:
+                item = self.dirs.pop(wd, None)
+                if item is not None and self.wd_of.get(item[1]) == wd:
+                    del self.wd_of[item[1]]
+                continue
+            item = self.dirs.get(wd)
+            if item is None:
+                continue
+            if mask & (IN_DELETE | IN_MOVED_FROM):
+                rel = item[1] + "/" + name if item[1] else name
+                self.live.discard(rel)
+                if mask & IN_ISDIR:
+                    self.live.discard(rel + "/")
+                    self._drop_tree(rel)
+            elif mask & (IN_CREATE | IN_MOVED_TO):
+                self._entry(item, name, bool(mask & IN_ISDIR))
+
+    def _poll(self) -> None:
+        for rel, (item, mtime_ns) in list(self.polled.items()):
+            try:
+                st = os.lstat(item[0])
+            except OSError:
+                del self.polled[rel]
+                continue
+            if st.st_mtime_ns == mtime_ns:
+                continue
+            self.polled[rel] = (item, st.st_mtime_ns)
+            _, found, subdirs = _scan_dir(item, self.cr, size_collapsed=False)
+            for m in found:
+                self._report(m)
+            for sub in subdirs:
+                if sub[1] not in self.wd_of and sub[1] not in self.polled:
+                    self._walk(sub, fresh=True)
+
+    def _apply_due(self, now: float) -> None:
+        while self.due and self.due[0][0] <= now:
+            _, m = self.due.popleft()
+            if m.rel not in self.live:
+                continue  # removed or moved away in the meantime
+            try:
+                if self.action(m):
+                    self.applied += 1
+            except OSError as e:
+                LOG.warning("Cannot process %s: %s", m.rel, e)
+
+    def run(self) -> None:
+        """Register watches, then process events until interrupted."""
+        self._listed_dirs = {
+            rel[: i + 1] for rel in self.live for i, c in enumerate(rel) if c == "/"
+        }
+        self._walk(self.root_item, fresh=False)
+        self._listed_dirs = set()
+        LOG.info(
+            "Watching %d directories (%d polled); Ctrl-C to stop.",
+            len(self.dirs),
+            len(self.polled),
+        )
+        next_poll = time.monotonic() + self.poll_every
+        while True:
+            now = time.monotonic()
+            timeout: Optional[float] = None
+            if self.polled:
+                timeout = max(0.0, next_poll - now)
+            if self.due:
+                t = max(0.0, self.due[0][0] - now)
+                timeout = t if timeout is None else min(timeout, t)
+            self._handle(self.inotify.read(timeout))
+            now = time.monotonic()
+            self._apply_due(now)
+            if now >= next_poll:
+                if self.polled:
+                    self._poll()
+                next_poll = now + self.poll_every
+
+
+def watch_tree(
+    root: Path,
+    rules_path: Path,
+    live: set[str],
+    list_out: Path,
+    fmt: str,
+    action: Optional[Callable[[Match], bool]],
+    delay: float,
+    poll_every: float,
+) -> int:
+    try:
+        watcher = Watcher(
+            root,
+            compile_rules(rules_path),
+            live,
+            list_out,
+            fmt,
+            action,
+            delay,
+            poll_every,
+        )
+    except OSError as e:
+        LOG.error("Cannot start watch mode: %s", e)
+        return 2
+    # Stop cleanly on SIGTERM too, as a daemon is usually stopped that way.
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)  # a repeated stop request
+        watcher.close()
+    LOG.info(
+        "Watch stopped: %d new matches, %d processed.", watcher.found, watcher.applied
+    )
+    return 0
+
+
+# -----------------------------
+# Several accounts (--all-roots)
+# -----------------------------
+
+
+@dataclass
+class RootScan:
+    """One account's scan with --all-roots, as sent back by its worker process."""
+
+    account: str
+    root: Path
+    list_out: Path
+    top: list[Match]  # largest matches, at most --top
+    total_size: int
+    scanned: int
+    count: int
+    seconds: float
+    metrics: Optional[dict[str, Any]] = None
+
+
+def _root_variant(path: Path, account: str) -> Path:
+    """path with the account before its suffix: ignored.txt -> ignored.business.txt."""
+    tag = re.sub(r"[^\w.-]", "_", account)
+    return path.with_name(f"{path.stem}.{tag}{path.suffix}")
+
+
+def scan_root(
+    account: str,
+    root: Path,
+    list_out: Path,
+    verbosity: int,
+    opts: dict[str, Any],
+    want_metrics: bool = False,
+    want_rule_stats: bool = False,
+) -> RootScan:
+    """
+    Scan one root with its own rules.dropboxignore (run in a worker process).
+    opts are collect_matches options; the log lines carry the account name.
+    """
+    setup_logging(verbosity, prefix=f"[{account}] ")
+    rules_path = root / "rules.dropboxignore"
+    metrics = Metrics() if want_metrics else None
+    rule_stats = RuleStats(compile_rules(rules_path)) if want_rule_stats else None
+    t0 = time.perf_counter()
+    matches, total_size, scanned, count = collect_matches(
+        root=root,
+        rules_path=rules_path,
+        list_out=list_out,
+        progress=False,
+        metrics=metrics,
+        rule_stats=rule_stats,
+        **opts,
+    )
+    seconds = time.perf_counter() - t0
+    if rule_stats is not None:
+        rows = rule_stats.report(root)
+        log_rule_stats(rows)
+        save_rule_stats(list_out, root.resolve(), rule_stats.cr, rows)
+    return RootScan(
+        account=account,
+        root=root,
+        list_out=list_out,
+        top=list(itertools.islice(matches, opts.get("top", 0))),
+        total_size=total_size,
+        scanned=scanned,
+        count=count,
+        seconds=seconds,
+        metrics=(
+            None
+            if metrics is None
+            else metrics.report(
+                account=account,
+                root=str(root),
+                files=scanned,
+                matches=count,
+                bytes=total_size,
+            )
+        ),
+    )
+
+
+def scan_all_roots(
+    roots: list[Tuple[str, Path]],
+    list_out: Path,
+    verbosity: int,
+    opts: dict[str, Any],
+    index_path: Optional[Path] = None,
+    want_metrics: bool = False,
+    want_rule_stats: bool = False,
+) -> list[RootScan]:
+    """
+    Scan every (account, root) at once, one worker process each, so the wall
+    time is that of the largest root. Each root gets its own list (and index)
+    named after the account; results come back in roots order.
+    """
+    with ProcessPoolExecutor(max_workers=len(roots)) as pool:
+        futures = [
+            pool.submit(
+                scan_root,
+                account,
+                root,
+                _root_variant(list_out, account),
+                verbosity,
+                dict(
+                    opts,
+                    index_path=(
+                        _root_variant(index_path, account) if index_path else None
+                    ),
+                ),
+                want_metrics,
+                want_rule_stats,
+            )
+            for account, root in roots
+        ]
+        return [f.result() for f in futures]
+
+
+def write_combined_list(
+    list_out: Path, fmt: str, parts: list[Tuple[Path, Path]]
+) -> None:
+    """
+    Concatenate per-root lists (root, list) into list_out, in the same format,
+    with every path made absolute by prefixing its root.
+    """
+    sep = b"\0" if fmt == "nul" else b"\n"
+    list_out.parent.mkdir(parents=True, exist_ok=True)
+    with open(list_out, "wb") as f:
+        for root, part in parts:
+            prefix = str(root).rstrip("/") + "/"
+            raw_prefix = prefix.encode("utf-8", "surrogateescape")
+            for rec in _iter_records(part, sep):
+                if fmt == "jsonl":
+                    obj = json.loads(rec)
+                    obj["path"] = prefix + obj["path"]
+                    f.write(json.dumps(obj).encode("ascii") + b"\n")
+                else:
+                    f.write(raw_prefix + rec + sep)
 
 
 # -----------------------------
@@ -631,12 +3438,26 @@ def build_parser() -> argparse.ArgumentParser:
         "--root", type=Path, default=None, help="Dropbox root (default: auto-detect)."
     )
     p.add_argument("--rules", type=Path, default=None, help="rules.dropboxignore path.")
+    p.add_argument(
+        "--all-roots",
+        action="store_true",
+        help="Scan every account root of ~/.dropbox/info.json concurrently, each "
+        "with its own rules and list (<list>.<account>), plus a combined --list "
+        "of absolute paths.",
+    )
     p.add_argument(
         "--list",
         dest="list_out",
         type=Path,
         default=Path("./dropbox_ignored_paths.txt"),
-        help="Write matched relative paths here.",
+        help="Write matched relative paths here ('-': stdout, implies --stream).",
+    )
+    p.add_argument(
+        "--format",
+        choices=LIST_FORMATS,
+        default="lines",
+        help="List format: one path per line, NUL-terminated paths, or JSON lines "
+        "with path, size and the deciding rule.",
     )
     action = p.add_mutually_exclusive_group()
     action.add_argument("--dry-run", action="store_true", help="No changes (default).")
@@ -647,12 +3468,123 @@ def build_parser() -> argparse.ArgumentParser:
     p.add_argument(
         "--yes", action="store_true", help="Required for --delete/--move-to."
     )
+    p.add_argument(
+        "--io-threads",
+        type=int,
+        default=8,
+        help="Threads deleting/moving matches (one directory at a time each).",
+    )
+    p.add_argument(
+        "--move-journal",
+        type=Path,
+        default=None,
+        help="Journal letting an interrupted cross-device --move-to resume "
+        "(default: <move-to>/.cleanup_dropbox_ignored.journal).",
+    )
+    p.add_argument(
+        "--keep-empty-dirs",
+        action="store_true",
+        help="Do not remove directories left empty by --delete.",
+    )
+    p.add_argument(
+        "--max-ops-per-sec",
+        type=float,
+        default=0.0,
+        help="Limit delete/move operations per second (0: unlimited).",
+    )
+    p.add_argument(
+        "--max-bytes-per-sec",
+        type=parse_bytes,
+        default=0,
+        help="Limit bytes deleted or copied per second, e.g. 50M (0: unlimited).",
+    )
+    p.add_argument(
+        "--adaptive-throttle",
+        action="store_true",
+        help="Also slow down delete/move while operation latency is well above "
+        "its baseline (the disk is busy).",
+    )
     p.add_argument("--top", type=int, default=25, help="Show N largest matches.")
+    p.add_argument(
+        "--stream",
+        action="store_true",
+        help="Write --list as matches are found (enumeration order, not sorted "
+        "by size) and keep only the --top largest in memory.",
+    )
+    p.add_argument(
+        "--walker",
+        choices=("find", "scandir"),
+        default=None,
+        help="Enumeration: `find -type f` (default) or an in-process scandir walk "
+        "that prunes ignored directories and lists each as one 'dir/' entry.",
+    )
+    p.add_argument(
+        "--jobs",
+        type=int,
+        default=1,
+        help="Threads reading directories in parallel (implies --walker scandir "
+        "when > 1).",
+    )
+    p.add_argument(
+        "--procs",
+        type=int,
+        default=1,
+        help="Processes matching `find` output in parallel (--walker find only).",
+    )
+    p.add_argument(
+        "--index",
+        dest="index_path",
+        type=Path,
+        default=None,
+        help="SQLite scan index reused across runs: only directories whose mtime "
+        "changed are listed again (scandir walk, single-threaded).",
+    )
+    p.add_argument(
+        "--watch",
+        action="store_true",
+        help="After the scan, watch the tree with inotify and append new matches "
+        "to --list (with --delete/--move-to, also process them).",
+    )
+    p.add_argument(
+        "--watch-delay",
+        type=float,
+        default=60.0,
+        help="Seconds a new match is left alone before --watch deletes/moves it.",
+    )
+    p.add_argument(
+        "--watch-poll",
+        type=float,
+        default=300.0,
+        help="Seconds between mtime polls of directories left unwatched once the "
+        "inotify watch limit is reached.",
+    )
+    p.add_argument(
+        "--metrics-json",
+        type=Path,
+        default=None,
+        help="Write per-stage times and counts (enumerate, match, stat, normalize, "
+        "sort, write, delete/move...) to this JSON file.",
+    )
+    p.add_argument(
+        "--explain-rules",
+        action="store_true",
+        help="Print the engine and estimated cost of each rule, with redundant "
+        "rules and negations flagged, then exit without scanning.",
+    )
+    p.add_argument(
+        "--rule-stats",
+        action="store_true",
+        help="Report matches and bytes per rule, and the cost of regex rules; "
+        "the counts are kept next to --list and, without negations, order the "
+        "rule checks of later scans (most matched first).",
+    )
     p.add_argument("--progress", action="store_true", help="Show progress bar (tqdm).")
     p.add_argument(
         "--count-first",
         action="store_true",
-        help="Pre-count files to make progress determinate (extra find pass).",
+        help="Pre-count files to make progress determinate (extra find pass). "
+        "Otherwise the total is the previous run's count (kept next to --list) "
+        "or, on a first run, a count running alongside the scan.",
     )
     p.add_argument(
         "--progress-every",
@@ -666,9 +3598,202 @@ def build_parser() -> argparse.ArgumentParser:
     return p
 
 
+def _engine_args(args: argparse.Namespace) -> Tuple[str, int, int]:
+    """(walker, jobs, procs) from the command line, warning about ignored options."""
+    jobs = max(1, args.jobs)
+    walker = args.walker or ("scandir" if jobs > 1 else "find")
+    if walker == "find" and jobs > 1:
+        LOG.warning("--jobs only applies to --walker scandir; using one find process.")
+    procs = max(1, args.procs)
+    if walker == "scandir" and procs > 1:
+        LOG.warning("--procs only applies to --walker find; ignoring it.")
+    if args.index_path is not None and (args.walker == "find" or jobs > 1 or procs > 1):
+        LOG.warning("--index uses its own single-threaded scandir walk.")
+    return walker, jobs, procs
+
+
+def _make_throttle(args: argparse.Namespace) -> Optional[Throttle]:
+    if args.max_ops_per_sec > 0 or args.max_bytes_per_sec > 0 or args.adaptive_throttle:
+        return Throttle(
+            max(0.0, args.max_ops_per_sec),
+            args.max_bytes_per_sec,
+            adaptive=args.adaptive_throttle,
+        )
+    return None
+
+
+def apply_action(
+    args: argparse.Namespace,
+    root: Path,
+    listed: Iterable[Match],
+    dest: Optional[Path],
+    journal: Optional[Path],
+    throttle: Optional[Throttle],
+    metrics: Optional[Metrics],
+) -> int:
+    """Move the matches of root to dest, or delete them if dest is None; returns rc."""
+    t_io = time.perf_counter()
+    if dest is not None:
+        ensure_outside_dropbox(dest, root)
+        dest.mkdir(parents=True, exist_ok=True)
+
+        moved, copied, failed = move_matches(
+            listed,
+            dest,
+            threads=max(1, args.io_threads),
+            journal_path=journal,
+            throttle=throttle,
+        )
+        LOG.info(
+            "Moved %d files to: %s (%s copied across filesystems).",
+            moved,
+            dest,
+            human_bytes(copied),
+        )
+        if metrics is not None:
+            metrics.add("move", time.perf_counter() - t_io, moved)
+        if failed:
+            LOG.error("%d moves failed; rerun to resume.", failed)
+            return 1
+        return 0
+
+    LOG.warning("Deleting files inside Dropbox will delete them from Dropbox cloud.")
+    deleted, pruned = delete_matches(
+        listed,
+        threads=max(1, args.io_threads),
+        prune_root=None if args.keep_empty_dirs else root,
+        throttle=throttle,
+    )
+    LOG.info("Deleted %d files; removed %d emptied directories.", deleted, pruned)
+    if metrics is not None:
+        metrics.add("delete", time.perf_counter() - t_io, deleted)
+    return 0
+
+
+def main_all_roots(args: argparse.Namespace) -> int:
+    """--all-roots: scan every linked account concurrently, then act on each."""
+    if args.root is not None or args.rules is not None:
+        LOG.error("--all-roots uses the roots of info.json and their own rules.")
+        return 2
+    if args.watch or args.explain_rules:
+        LOG.error("--watch and --explain-rules work on a single root.")
+        return 2
+    list_out = args.list_out.expanduser()
+    if str(list_out) == "-":
+        LOG.error("--all-roots needs a --list file, not stdout.")
+        return 2
+    if args.progress:
+        LOG.warning("No progress bars with --all-roots; see --progress-every.")
+    try:
+        roots = detect_dropbox_roots()
+    except FileNotFoundError as e:
+        LOG.error("%s", e)
+        return 2
+    ready = []
+    for account, root in roots:
+        if not (root / "rules.dropboxignore").exists():
+            LOG.error("Skipping %s: no rules.dropboxignore in %s", account, root)
+        else:
+            ready.append((account, root))
+    if not ready:
+        return 2
+
+    walker, jobs, procs = _engine_args(args)
+    metrics = Metrics() if args.metrics_json else None
+    with timed(metrics, "scan", len(ready)):
+        scans = scan_all_roots(
+            ready,
+            list_out,
+            args.verbose,
+            dict(
+                count_first=args.count_first,
+                progress_every=max(0, args.progress_every),
+                walker=walker,
+                jobs=jobs,
+                procs=procs,
+                stream=args.stream,
+                top=max(0, args.top),
+                fmt=args.format,
+            ),
+            index_path=args.index_path.expanduser() if args.index_path else None,
+            want_metrics=metrics is not None,
+            want_rule_stats=args.rule_stats,
+        )
+    with timed(metrics, "combine", len(scans)):
+        write_combined_list(
+            list_out, args.format, [(s.root.resolve(), s.list_out) for s in scans]
+        )
+
+    for s in scans:
+        LOG.info(
+            "%-10s %s: %d files scanned, %d matches, %s (%.1fs); list %s",
+            s.account,
+            s.root,
+            s.scanned,
+            s.count,
+            human_bytes(s.total_size),
+            s.seconds,
+            s.list_out,
+        )
+    scanned = sum(s.scanned for s in scans)
+    count = sum(s.count for s in scans)
+    total_size = sum(s.total_size for s in scans)
+    LOG.info("All roots    : %d", len(scans))
+    LOG.info("Scanned      : %d files", scanned)
+    LOG.info("Matches      : %d files", count)
+    LOG.info("Total size   : %s", human_bytes(total_size))
+    LOG.info("List written : %s", list_out.resolve())
+    top = sorted(
+        ((m, s.account) for s in scans for m in s.top),
+        key=lambda t: (-t[0].size, t[0].rel),
+    )[: args.top]
+    LOG.info("Top %d largest matches:", len(top))
+    for m, account in top:
+        LOG.info("  %10s  %s: %s", human_bytes(m.size), account, m.rel)
+
+    rc = 0
+    if not args.delete and args.move_to is None:
+        LOG.info("Dry run: no changes made.")
+    elif not args.yes:
+        LOG.error("Refusing to modify files without --yes.")
+        return 3
+    else:
+        throttle = _make_throttle(args)
+        for s in scans:
+            # One subdirectory of --move-to per account, so their paths never mix.
+            dest = args.move_to.expanduser() / s.account if args.move_to else None
+            journal = (
+                _root_variant(args.move_journal.expanduser(), s.account)
+                if args.move_journal
+                else None
+            )
+            listed = iter_listed_matches(s.root, s.list_out, args.format)
+            rc = (
+                apply_action(args, s.root, listed, dest, journal, throttle, metrics)
+                or rc
+            )
+
+    if metrics is not None:
+        metrics_path = args.metrics_json.expanduser()
+        metrics.write(
+            metrics_path,
+            roots=[s.metrics for s in scans],
+            walker=walker,
+            jobs=jobs,
+            procs=procs,
+            files=scanned,
+            matches=count,
+            bytes=total_size,
+        )
+        LOG.info("Metrics      : %s", metrics_path)
+    return rc
+
+
 def main(argv: Optional[list[str]] = None) -> int:
     args = build_parser().parse_args(argv)
     setup_logging(args.verbose)
+    if args.all_roots:
+        return main_all_roots(args)
 
     try:
         root = args.root.expanduser() if args.root else detect_dropbox_root()
@@ -685,70 +3810,143 @@ def main(argv: Optional[list[str]] = None) -> int:
     if not rules_path.exists():
         LOG.error("rules.dropboxignore not found at: %s", rules_path)
         return 2
+    if args.explain_rules:
+        cr = compile_rules(rules_path)
+        print_rule_explanation(explain_rules(cr, root), cr, rules_path)
+        return 0
 
     list_out = args.list_out.expanduser()
     progress_every = args.progress_every if args.progress_every > 0 else 0
+    walker, jobs, procs = _engine_args(args)
+    stream = args.stream or str(list_out) == "-"
+    if str(list_out) == "-" and (args.delete or args.move_to is not None):
+        LOG.error("--delete/--move-to need a --list file, not stdout.")
+        return 2
+    index_path = args.index_path.expanduser() if args.index_path else None
 
-    matches, total_size, scanned = collect_matches(
+    # Matches already listed, which --watch must not report again.
+    live: Optional[set[str]] = (
+        set() if args.watch and not (args.delete or args.move_to) else None
+    )
+    metrics = Metrics() if args.metrics_json else None
+    rule_stats = RuleStats(compile_rules(rules_path)) if args.rule_stats else None
+    matches, total_size, scanned, count = collect_matches(
         root=root,
         rules_path=rules_path,
         list_out=list_out,
         progress=args.progress,
         count_first=args.count_first,
         progress_every=progress_every,
+        walker=walker,
+        jobs=jobs,
+        procs=procs,
+        index_path=index_path,
+        stream=stream,
+        top=max(0, args.top),
+        fmt=args.format,
+        seen=live,
+        metrics=metrics,
+        rule_stats=rule_stats,
+    )
+    # Streaming keeps only the top matches in memory; the rest are in the list.
+    listed: Callable[[], Iterator[Match]] = (
+        partial(iter_listed_matches, root, list_out, args.format)
+        if stream
+        else partial(iter, matches)
     )
 
     LOG.info("Dropbox root : %s", root)
     LOG.info("Rules file   : %s", rules_path)
     LOG.info("Scanned      : %d files", scanned)
-    LOG.info("Matches      : %d files", len(matches))
+    LOG.info("Matches      : %d files", count)
     LOG.info("Total size   : %s", human_bytes(total_size))
-    LOG.info("List written : %s", list_out.resolve())
+    LOG.info(
+        "List written : %s", "stdout" if str(list_out) == "-" else list_out.resolve()
+    )
 
-    LOG.info("Top %d largest matches:", min(args.top, len(matches)))
-    for m in matches[: args.top]:
+    LOG.info("Top %d largest matches:", min(args.top, count))
+    for m in itertools.islice(matches, args.top):
         LOG.info("  %10s  %s", human_bytes(m.size), m.rel)
 
-    do_move = args.move_to is not None
-    do_delete = bool(args.delete)
-    if not do_move and not do_delete:
-        LOG.info("Dry run: no changes made.")
-        return 0
+    rule_rows: Optional[list[dict[str, Any]]] = None
+    if rule_stats is not None:
+        rule_rows = rule_stats.report(root)
+        log_rule_stats(rule_rows)
+        LOG.info(
+            "Rule stats   : %s",
+            save_rule_stats(list_out, root.resolve(), rule_stats.cr, rule_rows),
+        )
 
-    if not args.yes:
+    action: Optional[Callable[[Match], bool]] = None
+    dest: Optional[Path] = None
+    rc = 0
+    if not args.delete and args.move_to is None:
+        LOG.info("Dry run: no changes made.")
+    elif not args.yes:
         LOG.error("Refusing to modify files without --yes.")
         return 3
-
-    if do_move:
-        dest = args.move_to.expanduser()
-        ensure_outside_dropbox(dest, root)
-        dest.mkdir(parents=True, exist_ok=True)
-
-        moved = 0
-        for m in matches:
-            if not m.path.exists():
-                continue
-            target = dest / m.rel
-            target.parent.mkdir(parents=True, exist_ok=True)
-            shutil.move(str(m.path), str(target))
-            moved += 1
-        LOG.info("Moved %d files to: %s", moved, dest)
-        return 0
-
-    if do_delete:
-        LOG.warning(
-            "Deleting files inside Dropbox will delete them from Dropbox cloud."
+    else:
+        dest = args.move_to.expanduser() if args.move_to is not None else None
+        journal = args.move_journal.expanduser() if args.move_journal else None
+        # One throttle for the run, --watch included: its limits hold throughout.
+        throttle = _make_throttle(args)
+        rc = apply_action(args, root, listed(), dest, journal, throttle, metrics)
+        if dest is None:
+            action = partial(delete_match, throttle=throttle)
+
+    if metrics is not None:
+        metrics_path = args.metrics_json.expanduser()
+        metrics.write(
+            metrics_path,
+            root=str(root),
+            walker=walker,
+            jobs=jobs,
+            procs=procs,
+            index=index_path is not None,
+            stream=stream,
+            files=scanned,
+            matches=count,
+            bytes=total_size,
+            **({"rules": rule_rows} if rule_rows is not None else {}),
         )
-        deleted = 0
-        for m in matches:
-            try:
-                m.path.unlink()
-                deleted += 1
-            except FileNotFoundError:
-                continue
-        LOG.info("Deleted %d files.", deleted)
-        return 0
-
+        LOG.info("Metrics      : %s", metrics_path)
+    if rc:
+        return rc
+
+    if args.watch:
+        # Moves go through the engine and journal of the first pass, resumable.
+        mover: Optional[_Mover] = None
+        move_failures = 0
+        if dest is not None:
+            mover = _Mover(dest, MoveJournal(journal or dest / MOVE_JOURNAL), throttle)
+
+            def move_one(m: Match) -> bool:
+                nonlocal move_failures
+                assert mover is not None
+                try:
+                    return mover.move(m)[0]
+                except OSError:
+                    move_failures += 1
+                    raise
+
+            action = move_one
+        # Processed matches are gone, so only a dry run starts with a live set.
+        try:
+            return watch_tree(
+                root,
+                rules_path,
+                live if live is not None else set(),
+                list_out,
+                args.format,
+                action,
+                delay=max(0.0, args.watch_delay),
+                poll_every=max(1.0, args.watch_poll),
+            )
+        finally:
+            if mover is not None:
+                mover.journal.close()
+                if not move_failures:
+                    mover.journal.path.unlink(missing_ok=True)
     return 0
 
 